@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import numpy as np
 import zipfile
+from survey_design import design_columns, weighted_means
 #define zip location 
 zip_path = './MentalHealth/brff_datasets.zip'
 
@@ -24,6 +25,8 @@ save_dir = './MentalHealth'
 #cols to keep 
 columns_needed = ["_STATE", "IMONTH", "IYEAR", "DISPCODE", "STATERE1", 
                   "GENHLTH", "PHYSHLTH", "MENTHLTH", "POORHLTH"]
+# survey design columns (weight, stratum, PSU) needed for the weighted estimates
+columns_needed += design_columns
 
 # Initialize list to store all the filtered data
 all_data = []
@@ -73,6 +76,8 @@ for year in year_folders:
 # Step 4: Combine all dataframes if data exists
 if all_data:
     final_df = pd.concat(all_data, ignore_index=True)
+    # keep the original column positions; design columns go last
+    final_df = final_df[[c for c in final_df.columns if c not in design_columns] + design_columns]
     print("\n🎉 Final dataset preview:")
     print(final_df.head())
     print("Total records after filtering:", len(final_df))
@@ -176,3 +181,17 @@ output_path = os.path.join(save_dir, "combined_mental_health_data_state_year_agg
 aggregated_df.to_csv(output_path, index=False)
 
 print(f"Final dataset saved to: {output_path}")
+
+# Survey-weighted state x month and state x year means of MENTHLTH (Taylor-linearized SEs)
+final_df["State"] = state_names
+weighted_outputs = {
+    "combined_mental_health_data_state_month_weighted.csv": ["State", "IYEAR", "IMONTH"],
+    "combined_mental_health_data_state_year_weighted.csv": ["State", "IYEAR"],
+}
+for filename, by in weighted_outputs.items():
+    weighted_df = weighted_means(final_df, by, value="MENTHLTH")
+    weighted_df = weighted_df.rename(columns={"IYEAR": "Year", "IMONTH": "Month",
+                                              "Mean": "MenHealth_WeightedMean", "SE": "MenHealth_SE"})
+    output_path = os.path.join(save_dir, filename)
+    weighted_df.to_csv(output_path, index=False)
+    print(f"Weighted dataset saved to: {output_path}")
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sys
+
+import pandas as pd
+from survey_design import design_columns
+
+# Paths relative to the repo root
+base_dir = './MentalHealth/unzipped_files/brff_datasets'
+store_dir = './cleaningOutput/brfss_store'
+combined_path = './cleaningOutput/combined_mental_health_data.csv'
+aggregated_paths = ['./cleaningOutput/combined_mental_health_data_state_year_aggregated.csv',
+                    './choropleth_files/cleaningOutput/combined_mental_health_data_state_year_aggregated.csv']
+
+# cols to keep
+columns_needed = ["_STATE", "IMONTH", "IYEAR", "DISPCODE", "STATERE1",
+                  "GENHLTH", "PHYSHLTH", "MENTHLTH", "POORHLTH"] + design_columns
+health_columns = ["GENHLTH", "PHYSHLTH", "MENTHLTH", "POORHLTH"]
+
+fips_to_abbrev = {
+    1: 'AL', 2: 'AK', 4: 'AZ', 5: 'AR', 6: 'CA', 8: 'CO', 9: 'CT', 10: 'DE', 11: 'DC', 12: 'FL',
+    13: 'GA', 15: 'HI', 16: 'ID', 17: 'IL', 18: 'IN', 19: 'IA', 20: 'KS', 21: 'KY', 22: 'LA',
+    23: 'ME', 24: 'MD', 25: 'MA', 26: 'MI', 27: 'MN', 28: 'MS', 29: 'MO', 30: 'MT', 31: 'NE',
+    32: 'NV', 33: 'NH', 34: 'NJ', 35: 'NM', 36: 'NY', 37: 'NC', 38: 'ND', 39: 'OH', 40: 'OK',
+    41: 'OR', 42: 'PA', 44: 'RI', 45: 'SC', 46: 'SD', 47: 'TN', 48: 'TX', 49: 'UT', 50: 'VT',
+    51: 'VA', 53: 'WA', 54: 'WV', 55: 'WI', 56: 'WY',
+    60: 'AS', 66: 'GU', 69: 'MP', 72: 'PR', 74: 'UM', 78: 'VI',   # territories
+}
+
+
+def filter_valid_vals(df):
+    # same filter as 250416mentalhealthdatacleaning.py: state residents with an answer to every health question
+    f2 = df[df['STATERE1'] == 1]
+    f3 = f2[
+        (f2['GENHLTH'].between(1, 30)) &
+        (f2['PHYSHLTH'].between(1, 30)) &
+        (f2['MENTHLTH'].between(1, 30)) &
+        (f2['POORHLTH'].between(1, 30))
+    ]
+    return f3
+
+
+def folder_hash(folder):
+    # sha1 over the names and bytes of a year folder's CSVs, read in 1 MB chunks
+    digest = hashlib.sha1()
+    for name in sorted(f for f in os.listdir(folder) if f.endswith('.csv')):
+        digest.update(name.encode())
+        with open(os.path.join(folder, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partition_stats(rows):
+    """
+    Sufficient statistics of one partition: respondent count and the sum of
+    every health column per (State, IYEAR, IMONTH). Sums and counts add up
+    across partitions, so the state-year (or state-month) means of the whole
+    dataset come from these small tables without reading the rows again.
+    A survey year's file also holds interviews from January of the next year,
+    so one (State, IYEAR) can draw on two partitions; adding handles that.
+    """
+    states = rows['_STATE'].astype(float).astype(int).map(fips_to_abbrev)
+    keys = pd.DataFrame({'State': states, 'IYEAR': rows['IYEAR'].astype(int), 'IMONTH': rows['IMONTH'].astype(int)})
+    sums = rows[health_columns].astype(float).groupby([keys['State'], keys['IYEAR'], keys['IMONTH']]).sum()
+    stats = sums.add_suffix('_sum')
+    stats.insert(0, 'N', keys.groupby(['State', 'IYEAR', 'IMONTH']).size())
+    return stats.reset_index()
+
+
+def read_manifest(store=store_dir):
+    path = os.path.join(store, 'manifest.json')
+    if not os.path.exists(path):
+        return {'partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, store=store_dir):
+    # write to a temporary file and rename, so a crash never leaves a half-written manifest
+    path = os.path.join(store, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def ingest_year(year, folder, store=store_dir):
+    """
+    Filter one survey year's CSVs into the store: rows_<year>.csv (respondent
+    rows, same columns as combined_mental_health_data.csv) and
+    stats_<year>.csv (partition_stats). Returns the number of rows kept.
+    """
+    frames = []
+    for name in sorted(f for f in os.listdir(folder) if f.endswith('.csv')):
+        df = pd.read_csv(os.path.join(folder, name), usecols=lambda c: c in columns_needed, low_memory=False)
+        filtered = filter_valid_vals(df)
+        if not filtered.empty:
+            frames.append(filtered.assign(YEAR=int(year)))
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns_needed + ['YEAR'])
+    # keep the original column positions; design columns go last
+    rows = rows[[c for c in rows.columns if c not in design_columns] + [c for c in design_columns if c in rows.columns]]
+    rows.to_csv(os.path.join(store, f"rows_{year}.csv"), index=False)
+    partition_stats(rows).to_csv(os.path.join(store, f"stats_{year}.csv"), index=False)
+    return len(rows)
+
+
+def ingest(source=base_dir, store=store_dir, force=False):
+    """
+    Bring the store up to date with the year folders under `source`. A year
+    is (re)processed only when its content hash differs from the manifest,
+    so a new BRFSS release costs one year of filtering. Partitions whose
+    folder disappeared are kept. Returns the list of years processed.
+    """
+    os.makedirs(store, exist_ok=True)
+    manifest = read_manifest(store)
+    updated = []
+    for year in sorted(y for y in os.listdir(source) if y.isdigit() and os.path.isdir(os.path.join(source, y))):
+        folder = os.path.join(source, year)
+        digest = folder_hash(folder)
+        known = manifest['partitions'].get(year)
+        if not force and known and known['hash'] == digest:
+            continue
+        n_rows = ingest_year(year, folder, store)
+        manifest['partitions'][year] = {'hash': digest, 'rows': n_rows}
+        # record each partition as soon as it is written, so an interrupted run resumes where it stopped
+        write_manifest(manifest, store)
+        updated.append(year)
+        print(f"Ingested {year}: {n_rows} rows")
+    return updated
+
+
+def merged_stats(store=store_dir):
+    # sum the per-partition statistics into one table per (State, IYEAR, IMONTH)
+    manifest = read_manifest(store)
+    frames = [pd.read_csv(os.path.join(store, f"stats_{year}.csv")) for year in sorted(manifest['partitions'])]
+    return pd.concat(frames, ignore_index=True).groupby(['State', 'IYEAR', 'IMONTH'], as_index=False).sum()
+
+
+def state_year_means(stats, column='MENTHLTH'):
+    # State, Year, MenHealth_MeanValue like the cleaning script's aggregated CSV
+    by_year = stats.groupby(['State', 'IYEAR'], as_index=False)[['N', f"{column}_sum"]].sum()
+    return pd.DataFrame({'State': by_year['State'], 'Year': by_year['IYEAR'].astype(float),
+                         'MenHealth_MeanValue': by_year[f"{column}_sum"] / by_year['N']})
+
+
+def write_combined(output=combined_path, store=store_dir):
+    """
+    Concatenate the partitions' row files into the combined CSV. Partitions
+    with the same header are appended byte for byte (no parsing); otherwise
+    it falls back to pandas. Written to a temporary file and renamed.
+    """
+    manifest = read_manifest(store)
+    paths = [os.path.join(store, f"rows_{year}.csv") for year in sorted(manifest['partitions'])]
+    headers = set()
+    for path in paths:
+        with open(path) as f:
+            headers.add(f.readline())
+    with open(output + '.tmp', 'w') as out:
+        if len(headers) == 1:
+            out.write(headers.pop())
+            for path in paths:
+                with open(path) as f:
+                    f.readline()
+                    for chunk in iter(lambda: f.read(1 << 20), ''):
+                        out.write(chunk)
+        else:
+            pd.concat([pd.read_csv(path) for path in paths], ignore_index=True).to_csv(out, index=False)
+    os.replace(output + '.tmp', output)
+
+
+def write_aggregated(stats, paths=aggregated_paths):
+    # MENTHLTH state-year means to every copy of the aggregate CSV, each written to a temporary file and renamed
+    aggregated = state_year_means(stats)
+    for path in paths:
+        aggregated.to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    return aggregated
+
+
+def refresh(source=base_dir, store=store_dir, force=False):
+    # ingest changed years, then rewrite the combined rows and the state-year aggregate
+    updated = ingest(source, store, force)
+    if not updated and not force:
+        print("Store is up to date")
+        return updated
+    write_combined(combined_path, store)
+    aggregated = write_aggregated(merged_stats(store))
+    print(f"Saved {combined_path} and {len(aggregated)} state-years to {', '.join(aggregated_paths)}")
+    return updated
+
+
+if __name__ == '__main__':
+    # python MentalHealth/brfss_store.py [source_dir] [--force]
+    # python MentalHealth/brfss_store.py --aggregate   (state-year aggregate from the combined CSV alone,
+    #                                                   for checkouts without the raw year folders)
+    if '--aggregate' in sys.argv:
+        aggregated = write_aggregated(partition_stats(pd.read_csv(combined_path)))
+        print(f"Saved {len(aggregated)} state-years to {', '.join(aggregated_paths)}")
+    else:
+        args = [a for a in sys.argv[1:] if a != '--force']
+        refresh(args[0] if args else base_dir, force='--force' in sys.argv)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# BRFSS design columns: final raking weight, stratum and primary sampling unit
+design_columns = ["_LLCPWT", "_STSTR", "_PSU"]
+
+
+def weighted_means(df, by, value='MENTHLTH', weight='_LLCPWT', strata='_STSTR', psu='_PSU', year='YEAR'):
+    """
+    Survey-weighted domain means with Taylor-linearized standard errors.
+
+    df   : respondent-level BRFSS rows carrying `value`, the design columns and `year`
+    by   : list of columns defining the domains (e.g. ['State', 'IYEAR', 'IMONTH'])
+
+    The mean of each domain g is the ratio  sum(w * y) / sum(w).  Its variance
+    is estimated from the linearized values  u = w * (y - mean_g) / sum_g(w),
+    totalled per PSU, with the usual with-replacement formula within each
+    stratum:  n_h / (n_h - 1) * sum_j (u_hj - mean_h(u))^2.  n_h counts every
+    PSU in the stratum (BRFSS strata are defined per survey year), including
+    PSUs with no respondents in the domain. Strata with a single PSU add no
+    variance.
+
+    Every step is a grouped sum over integer codes, so the cost is a handful
+    of passes over the rows regardless of how many domains there are.
+    Returns a DataFrame with by + [Mean, SE, N, SumWeights].
+    """
+    df = df[by + [value, weight, strata, psu, year]].dropna()
+    y = df[value].to_numpy(dtype=float)
+    w = df[weight].to_numpy(dtype=float)
+
+    # integer codes for domains, strata (per survey year) and PSUs within strata
+    domains = df.groupby(by, sort=True)
+    domain = domains.ngroup().to_numpy()
+    stratum = df.groupby([year, strata], sort=False).ngroup().to_numpy()
+    unit = df.groupby([year, strata, psu], sort=False).ngroup().to_numpy()
+    n_domains = domain.max() + 1
+
+    # point estimates
+    sum_w = np.bincount(domain, weights=w, minlength=n_domains)
+    sum_wy = np.bincount(domain, weights=w * y, minlength=n_domains)
+    mean = sum_wy / sum_w
+
+    # linearized values, totalled per (domain, PSU)
+    u = w * (y - mean[domain]) / sum_w[domain]
+    n_units = unit.max() + 1
+    pair_key, pair = pd.factorize(domain.astype(np.int64) * n_units + unit)
+    u_psu = np.bincount(pair_key, weights=u)
+    pair_domain, pair_unit = pair // n_units, pair % n_units
+
+    # stratum of every PSU and PSUs per stratum over the whole sample, not just the domain
+    unit_stratum = np.zeros(n_units, dtype=np.int64)
+    unit_stratum[unit] = stratum
+    n_strata = stratum.max() + 1
+    psu_count = np.bincount(unit_stratum, minlength=n_strata).astype(float)
+
+    # n_h / (n_h - 1) * sum_j (u_hj - mean_h(u))^2 per (domain, stratum), summed over strata
+    cell_key, cell = pd.factorize(pair_domain * n_strata + unit_stratum[pair_unit])
+    u_sum = np.bincount(cell_key, weights=u_psu)
+    u2_sum = np.bincount(cell_key, weights=u_psu ** 2)
+    n_h = psu_count[cell % n_strata]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_h = np.where(n_h > 1, n_h / (n_h - 1) * (u2_sum - u_sum ** 2 / n_h), 0.0)
+    var = np.bincount(cell // n_strata, weights=var_h, minlength=n_domains)
+
+    keys = domains.size().index.to_frame(index=False)
+    keys['Mean'] = mean
+    keys['SE'] = np.sqrt(var)
+    keys['N'] = np.bincount(domain, minlength=n_domains)
+    keys['SumWeights'] = sum_w
+    return keys
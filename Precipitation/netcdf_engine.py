@@ -0,0 +1,536 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import sparse
+
+# Default config, paths relative to the repo root
+config_path = './Precipitation/weather_variables.json'
+
+
+class GridMapping:
+    """
+    Cell -> state weights for one lat/lon grid, as a sparse (states x cells)
+    matrix. A state's value for a time step is the weighted mean of the
+    non-missing cells:  (W @ (v * valid)) / (W @ valid).
+
+    Schemes: 'centroid' gives every cell whose centre lies inside a state
+    polygon a weight of 1 (the point-in-polygon join the cleaning script used
+    before); 'area' weights cells by their exact overlap with the state and
+    cos(latitude); 'population' weights cells by the number of people of that
+    state living in them (see population_weights).
+    """
+
+    def __init__(self, states, weights, key):
+        self.states = np.asarray(states).astype(str)
+        self.weights = weights.tocsr()
+        self.key = key
+
+    def apply(self, values):
+        # values: (time, cells) -> (time, states) weighted means, NaN where no valid cell
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        totals = (self.weights @ filled.T).T
+        norms = (self.weights @ valid.T.astype(float)).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(norms > 0, totals / norms, np.nan)
+
+    def partial_sums(self, values, start, stop):
+        """
+        Weighted sums and weight totals for a block of cells [start, stop)
+        (in flattened lat x lon order). Blocks can be summed and divided at the
+        end, which gives exactly the same means as apply() on the full grid.
+        values: (time, stop - start) -> two (time, states) arrays
+        """
+        if not hasattr(self, '_columns'):
+            self._columns = self.weights.tocsc()
+        block = self._columns[:, start:stop]
+        valid = ~np.isnan(values)
+        totals = (block @ np.where(valid, values, 0.0).T).T
+        norms = (block @ valid.T.astype(float)).T
+        return totals, norms
+
+    def used_rows(self, n_lon):
+        # latitude rows that carry any weight; other rows never need to be read
+        cells = np.flatnonzero(np.diff(self.weights.tocsc().indptr))
+        return np.unique(cells // n_lon)
+
+
+def grid_key(latitude, longitude, scheme='centroid'):
+    # Identify a grid by its coordinates so each distinct grid is mapped once
+    digest = hashlib.sha1()
+    for coords in (latitude, longitude):
+        digest.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+    digest.update(scheme.encode())
+    return digest.hexdigest()[:16]
+
+
+def _wrap_longitude(longitude):
+    # 0..360 grids -> -180..180, like the original cleaning script
+    longitude = np.asarray(longitude, dtype=float)
+    return np.where(longitude > 180, longitude - 360, longitude)
+
+
+def centroid_weights(latitude, longitude, regions, id_column='STUSPS'):
+    """
+    One weight per cell whose centre lies within a region polygon.
+    Returns (region ids, sparse (regions x cells) matrix).
+    """
+    import shapely
+    lon2d, lat2d = np.meshgrid(_wrap_longitude(longitude), np.asarray(latitude, dtype=float))
+    points = shapely.points(lon2d.ravel(), lat2d.ravel())
+    cell_idx, region_idx = regions.sindex.query(points, predicate='within')
+    ids = regions[id_column].to_numpy().astype(str)
+    weights = sparse.csr_matrix((np.ones(len(cell_idx)), (region_idx, cell_idx)),
+                                shape=(len(ids), points.size))
+    return ids, weights
+
+
+def _cell_edges(coords):
+    # half-way points between cell centres, extrapolated at both ends
+    coords = np.asarray(coords, dtype=float)
+    if len(coords) == 1:
+        return coords - 0.5, coords + 0.5
+    mid = (coords[1:] + coords[:-1]) / 2
+    edges = np.concatenate([[2 * coords[0] - mid[0]], mid, [2 * coords[-1] - mid[-1]]])
+    return np.minimum(edges[:-1], edges[1:]), np.maximum(edges[:-1], edges[1:])
+
+
+def area_weights(latitude, longitude, regions, id_column='STUSPS'):
+    """
+    Weight of each cell in each region = fraction of the cell polygon that
+    overlaps the region x cos(latitude), i.e. proportional to the true
+    overlapping area. Cells only partly inside a small state (RI, DE, DC, ...)
+    still count, and cells on a border are shared between the states.
+    Returns (region ids, sparse (regions x cells) matrix).
+    """
+    import shapely
+    lat_lo, lat_hi = _cell_edges(latitude)
+    lon_lo, lon_hi = _cell_edges(longitude)
+    lat_lo, lat_hi = np.clip(lat_lo, -90, 90), np.clip(lat_hi, -90, 90)
+    lon_shift = np.where(np.asarray(longitude, dtype=float) > 180, -360.0, 0.0)
+    lon_lo, lon_hi = lon_lo + lon_shift, lon_hi + lon_shift
+
+    n_lat, n_lon = len(lat_lo), len(lon_lo)
+    cells = shapely.box(np.tile(lon_lo, n_lat), np.repeat(lat_lo, n_lon),
+                        np.tile(lon_hi, n_lat), np.repeat(lat_hi, n_lon))
+
+    # only cell/region pairs whose bounding boxes meet are intersected
+    cell_idx, region_idx = regions.sindex.query(cells, predicate='intersects')
+    geoms = regions.geometry.to_numpy()
+    overlap = shapely.area(shapely.intersection(cells[cell_idx], geoms[region_idx]))
+    fraction = overlap / shapely.area(cells[cell_idx])
+    cos_lat = np.cos(np.deg2rad(np.repeat(np.asarray(latitude, dtype=float), n_lon)))[cell_idx]
+
+    keep = fraction > 0
+    ids = regions[id_column].to_numpy().astype(str)
+    weights = sparse.csr_matrix(((fraction * cos_lat)[keep], (region_idx[keep], cell_idx[keep])),
+                                shape=(len(ids), n_lat * n_lon))
+    return ids, weights
+
+
+def _nearest_cell(coords, values):
+    # index of the grid cell containing each value, -1 if outside the grid
+    lo, hi = _cell_edges(coords)
+    order = np.argsort(coords)
+    sorted_coords = np.asarray(coords, dtype=float)[order]
+    mids = (sorted_coords[1:] + sorted_coords[:-1]) / 2
+    idx = order[np.searchsorted(mids, values)]
+    inside = (values >= lo[idx]) & (values <= hi[idx])
+    return np.where(inside, idx, -1)
+
+
+def read_population(source, bounds=None):
+    """
+    Population counts as points (longitude, latitude, population) from a
+    user-provided file, described by the "population" block of the config:
+      {"csv": path, "longitude": col, "latitude": col, "value": col}
+          one row per place, e.g. county population with the county's
+          internal point (Census gazetteer INTPTLONG / INTPTLAT)
+      {"raster": path, "variable": name}
+          a gridded population count (people per pixel); .nc files are read
+          with xarray, .asc as an ESRI ASCII grid, anything else with rasterio
+    Raster pixels are used as points at their centres; pixels outside `bounds`
+    (min lon, min lat, max lon, max lat) or with no population are dropped.
+    """
+    if 'csv' in source:
+        table = pd.read_csv(source['csv'])
+        lon = table[source.get('longitude', 'longitude')].to_numpy(dtype=float)
+        lat = table[source.get('latitude', 'latitude')].to_numpy(dtype=float)
+        pop = table[source.get('value', 'population')].to_numpy(dtype=float)
+    else:
+        path = source['raster']
+        if path.endswith('.nc'):
+            with xr.open_dataset(path) as ds:
+                grid = ds[source['variable']].squeeze()
+                lat_name, lon_name = grid.dims
+                counts = grid.values.astype(float)
+                lat_c, lon_c = ds[lat_name].values, ds[lon_name].values
+        elif path.endswith('.asc'):
+            with open(path) as f:
+                header = dict(next(f).split() for _ in range(6))
+            header = {key.lower(): float(value) for key, value in header.items()}
+            counts = np.loadtxt(path, skiprows=6)
+            counts[counts == header.get('nodata_value', -9999)] = np.nan
+            size = header['cellsize']
+            lon_c = header['xllcorner'] + size * (np.arange(counts.shape[1]) + 0.5)
+            lat_c = header['yllcorner'] + size * (np.arange(counts.shape[0])[::-1] + 0.5)
+        else:
+            import rasterio
+            with rasterio.open(path) as raster:
+                counts = raster.read(1, masked=True).filled(np.nan).astype(float)
+                rows, cols = np.arange(raster.height), np.arange(raster.width)
+                lon_c = np.array(raster.xy(np.zeros_like(cols), cols)[0])
+                lat_c = np.array(raster.xy(rows, np.zeros_like(rows))[1])
+        lon2d, lat2d = np.meshgrid(_wrap_longitude(lon_c), lat_c)
+        lon, lat, pop = lon2d.ravel(), lat2d.ravel(), counts.ravel()
+
+    keep = np.isfinite(pop) & (pop > 0)
+    if bounds is not None:
+        keep &= (lon >= bounds[0]) & (lat >= bounds[1]) & (lon <= bounds[2]) & (lat <= bounds[3])
+    return lon[keep], lat[keep], pop[keep]
+
+
+def population_weights(latitude, longitude, regions, population, id_column='STUSPS'):
+    """
+    Weight of a cell in a region = population of that region living inside
+    the cell. Every population point is assigned to its region (point in
+    polygon) and to the grid cell containing it, so a border cell is split
+    between the states by where the people actually are.
+    `population` is a (longitude, latitude, count) tuple from read_population.
+    Returns (region ids, sparse (regions x cells) matrix).
+    """
+    import shapely
+    lon, lat, pop = population
+    point_idx, region_idx = regions.sindex.query(shapely.points(lon, lat), predicate='within')
+
+    grid_lon = _wrap_longitude(longitude)
+    row = _nearest_cell(np.asarray(latitude, dtype=float), lat[point_idx])
+    col = _nearest_cell(grid_lon, lon[point_idx])
+    keep = (row >= 0) & (col >= 0)
+    cell_idx = row[keep] * len(grid_lon) + col[keep]
+
+    ids = regions[id_column].to_numpy().astype(str)
+    weights = sparse.csr_matrix((pop[point_idx][keep], (region_idx[keep], cell_idx)),
+                                shape=(len(ids), len(latitude) * len(grid_lon)))
+    weights.sum_duplicates()
+    return ids, weights
+
+
+class GridMappingCache:
+    """
+    Builds GridMapping objects on demand and keeps them in memory and on disk
+    (one .npz per grid in `cache_dir`), so the polygon work happens once per
+    distinct grid across all files, variables and runs. Mappings for every
+    scheme are kept side by side, so switching schemes never needs the
+    NetCDF files again.
+    """
+
+    def __init__(self, shapefile_path, cache_dir='./cleaningOutput/grid_cache', id_column='STUSPS',
+                 population=None):
+        self.shapefile_path = shapefile_path
+        self.cache_dir = cache_dir
+        self.id_column = id_column
+        self.population = population
+        self._regions = None
+        self._population_points = None
+        self._mappings = {}
+
+    @property
+    def regions(self):
+        if self._regions is None:
+            import geopandas as gpd
+            self._regions = gpd.read_file(self.shapefile_path).to_crs("EPSG:4326")
+        return self._regions
+
+    def scheme_key(self, scheme):
+        # the same grid maps differently onto states and counties, so the regions are part of the key
+        regions = f"{os.path.basename(self.shapefile_path)}:{self.id_column}"
+        if scheme != 'population':
+            return f"{scheme}:{regions}"
+        # population weights also depend on the population file, so its hash is part of the key
+        if not self.population:
+            raise ValueError("The 'population' scheme needs a \"population\" block in the config")
+        path = self.population.get('csv', self.population.get('raster'))
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        return f"population:{digest}:{json.dumps(self.population, sort_keys=True)}:{regions}"
+
+    def get(self, latitude, longitude, scheme='centroid'):
+        key = grid_key(latitude, longitude, self.scheme_key(scheme))
+        if key in self._mappings:
+            return self._mappings[key]
+
+        path = os.path.join(self.cache_dir, f"{key}.npz") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as cached:
+                ids = cached['states'].astype(str)
+                weights = sparse.csr_matrix((cached['data'], cached['indices'], cached['indptr']),
+                                            shape=tuple(cached['shape']))
+        else:
+            ids, weights = self.build(latitude, longitude, scheme)
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.savez_compressed(path, states=ids, data=weights.data, indices=weights.indices,
+                                    indptr=weights.indptr, shape=np.array(weights.shape))
+
+        self._mappings[key] = GridMapping(ids, weights, key)
+        return self._mappings[key]
+
+    def build(self, latitude, longitude, scheme):
+        if scheme == 'centroid':
+            return centroid_weights(latitude, longitude, self.regions, self.id_column)
+        if scheme == 'area':
+            return area_weights(latitude, longitude, self.regions, self.id_column)
+        if scheme == 'population':
+            if self._population_points is None:
+                self._population_points = read_population(self.population, self.regions.total_bounds)
+            return population_weights(latitude, longitude, self.regions, self._population_points,
+                                      self.id_column)
+        raise ValueError(f"Unknown weighting scheme: {scheme}")
+
+
+def read_file(file_path, variables):
+    """
+    Read every configured variable found in one NetCDF file in a single pass.
+    Returns a list of dicts with the variable name, its grid coordinates, the
+    time stamps and a (time, cells) array of values.
+    """
+    fields = []
+    with xr.open_dataset(file_path) as ds:
+        for spec in variables:
+            if spec['netcdf_variable'] not in ds:
+                continue
+            lat_name = spec.get('latitude', 'latitude')
+            lon_name = spec.get('longitude', 'longitude')
+            data_var = ds[spec['netcdf_variable']].transpose('time', lat_name, lon_name)
+            values = data_var.values.reshape(data_var.sizes['time'], -1).astype(float)
+            fields.append({
+                'name': spec['name'],
+                'latitude': ds[lat_name].values,
+                'longitude': ds[lon_name].values,
+                'time': data_var['time'].values,
+                'values': values * spec.get('scale', 1.0) + spec.get('offset', 0.0),
+            })
+    return fields
+
+
+def _fields_key(file_path, variables):
+    # cached cell values are valid as long as the file and the variable specs are unchanged
+    digest = hashlib.sha1(json.dumps(variables, sort_keys=True).encode())
+    stat = os.stat(file_path)
+    digest.update(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def read_fields(files, variables, cache_dir=None):
+    """
+    read_file over a list of files, with each file's (time, cells) values
+    cached in `cache_dir` as fields_<hash>.npz. Re-running with another
+    weighting scheme then only loads these files instead of decoding the
+    NetCDF files again, and a new file costs one decode.
+    """
+    fields = []
+    for file_path in files:
+        path = os.path.join(cache_dir, f"fields_{_fields_key(file_path, variables)}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as cached:
+                fields.extend({
+                    'name': str(cached[f'name_{i}']),
+                    'latitude': cached[f'latitude_{i}'],
+                    'longitude': cached[f'longitude_{i}'],
+                    'time': cached[f'time_{i}'],
+                    'values': cached[f'values_{i}'].astype(float),
+                } for i in range(int(cached['count'])))
+            continue
+        file_fields = read_file(file_path, variables)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            arrays = {'count': len(file_fields)}
+            for i, field in enumerate(file_fields):
+                arrays.update({f'{key}_{i}': value for key, value in field.items()})
+            np.savez_compressed(path, **arrays)
+        fields.extend(file_fields)
+    return fields
+
+
+def aggregate_fields(fields, mappings, scheme='centroid'):
+    """
+    Stack the fields of each (variable, grid) over all files and apply the
+    grid's weight matrix to every time step in one sparse product.
+    Returns a list of long DataFrames.
+    """
+    stacks = {}
+    for field in fields:
+        mapping = mappings.get(field['latitude'], field['longitude'], scheme)
+        stacks.setdefault((field['name'], mapping.key), (mapping, []))[1].append(field)
+
+    frames = []
+    for (name, _), (mapping, group) in stacks.items():
+        times = np.concatenate([field['time'] for field in group])
+        state_values = mapping.apply(np.concatenate([field['values'] for field in group]))
+        frames.append(pd.DataFrame({
+            'time': np.repeat(times, len(mapping.states)),
+            'state_abbr': np.tile(mapping.states, len(times)),
+            'variable': name,
+            'value': state_values.ravel(),
+        }))
+    return frames
+
+
+def _block_shape(n_time, n_lat, n_lon, max_block_mb):
+    # time steps x latitude rows per block so that a block (plus the few
+    # float64 temporaries made while reducing it) stays under max_block_mb
+    budget = max_block_mb * 1024 ** 2 / (8 * 4)
+    lat_rows = int(max(1, min(n_lat, budget // n_lon)))
+    time_steps = int(max(1, min(n_time, budget // (lat_rows * n_lon))))
+    return time_steps, lat_rows
+
+
+def file_partial_sums(file_path, variables, mappings, scheme='centroid', max_block_mb=256):
+    """
+    Per-state weighted sums and weight totals for every time step of one
+    file, read lazily in time x latitude blocks of at most `max_block_mb`.
+    Every block is reduced before the next one is loaded, and latitude rows
+    with no state cells are never read.
+    Returns a list of dicts with the variable name, its mapping, the time
+    stamps and two (time, states) arrays: 'sums' and 'norms'.
+    """
+    parts = []
+    with xr.open_dataset(file_path) as ds:
+        for spec in variables:
+            if spec['netcdf_variable'] not in ds:
+                continue
+            lat_name = spec.get('latitude', 'latitude')
+            lon_name = spec.get('longitude', 'longitude')
+            mapping = mappings.get(ds[lat_name].values, ds[lon_name].values, scheme)
+            data_var = ds[spec['netcdf_variable']].transpose('time', lat_name, lon_name)
+            n_time, n_lat, n_lon = (data_var.sizes[d] for d in ('time', lat_name, lon_name))
+            sums = np.zeros((n_time, len(mapping.states)))
+            norms = np.zeros_like(sums)
+
+            rows = mapping.used_rows(n_lon)
+            if len(rows) == 0:
+                continue
+            time_steps, lat_rows = _block_shape(n_time, rows[-1] - rows[0] + 1, n_lon, max_block_mb)
+            for t0 in range(0, n_time, time_steps):
+                t1 = min(t0 + time_steps, n_time)
+                for y0 in range(rows[0], rows[-1] + 1, lat_rows):
+                    y1 = min(y0 + lat_rows, rows[-1] + 1)
+                    block = data_var.isel({'time': slice(t0, t1), lat_name: slice(y0, y1)}).values
+                    block = block.reshape(t1 - t0, -1).astype(float) * spec.get('scale', 1.0) + spec.get('offset', 0.0)
+                    block_sums, block_norms = mapping.partial_sums(block, y0 * n_lon, y1 * n_lon)
+                    sums[t0:t1] += block_sums
+                    norms[t0:t1] += block_norms
+            parts.append({'name': spec['name'], 'mapping': mapping, 'time': data_var['time'].values,
+                          'sums': sums, 'norms': norms})
+    return parts
+
+
+def aggregate_chunked(files, variables, mappings, scheme='centroid', max_block_mb=256):
+    """
+    Bounded-memory alternative to read_fields + aggregate_fields for large
+    (daily / high-resolution) products, aggregated to calendar months.
+    The per-time-step sums of every file are collected first (a few numbers
+    per state and step) and each month is divided once at the end, so a month
+    spread over 30 daily files is the mean of all 30. A time step found in a
+    later file replaces the earlier one (GPCP's final monthly files sort after
+    the preliminary ones).
+
+    The monthly means equal sum(weight * value) / sum(weight) over every valid
+    cell and time step in the month, so monthly files give exactly the same
+    result as the in-memory path.
+    """
+    steps = {}
+    for file_path in files:
+        for part in file_partial_sums(file_path, variables, mappings, scheme, max_block_mb):
+            mapping, by_time = steps.setdefault((part['name'], part['mapping'].key), (part['mapping'], {}))
+            for i, time in enumerate(part['time']):
+                by_time[time] = (part['sums'][i], part['norms'][i])
+
+    frames = []
+    for (name, _), (mapping, by_time) in steps.items():
+        times = np.array(sorted(by_time))
+        out_months, month_idx = np.unique(times.astype('datetime64[M]'), return_inverse=True)
+        sums = np.zeros((len(out_months), len(mapping.states)))
+        norms = np.zeros_like(sums)
+        np.add.at(sums, month_idx, np.array([by_time[time][0] for time in times]))
+        np.add.at(norms, month_idx, np.array([by_time[time][1] for time in times]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            state_values = np.where(norms > 0, sums / norms, np.nan)
+        frames.append(pd.DataFrame({
+            'time': np.repeat(out_months.astype('datetime64[ns]'), len(mapping.states)),
+            'state_abbr': np.tile(mapping.states, len(out_months)),
+            'variable': name,
+            'value': state_values.ravel(),
+        }))
+    return frames
+
+
+def run(config, scheme=None):
+    """
+    Process every source in the config and return one long, typed table keyed
+    by (time, state_abbr, variable). Files are processed in sorted order and a
+    later file replaces earlier values for the same key (GPCP's final monthly
+    files sort after the preliminary ones).
+    `scheme` overrides the config's "weighting" (centroid / area / population).
+    """
+    cache_dir = config.get('grid_cache', './cleaningOutput/grid_cache')
+    mappings = GridMappingCache(config['shapefile'], cache_dir, config.get('id_column', 'STUSPS'),
+                                population=config.get('population'))
+    scheme = scheme or config.get('weighting', 'centroid')
+
+    frames = []
+    for source in config['sources']:
+        files = sorted(glob.glob(source['files']))
+        # sources with a memory budget are streamed block by block and aggregated to months
+        if 'max_block_mb' in source:
+            frames.extend(aggregate_chunked(files, source['variables'], mappings, scheme, source['max_block_mb']))
+        else:
+            # the weights are applied per batch of files (one sparse product per variable and batch),
+            # so only one batch of grids is in memory at a time
+            batch = source.get('batch_files', 64)
+            for i in range(0, len(files), batch):
+                fields = read_fields(files[i:i + batch], source['variables'], cache_dir)
+                frames.extend(aggregate_fields(fields, mappings, scheme))
+
+    table = pd.concat(frames, ignore_index=True).dropna(subset=['value'])
+    table = table.drop_duplicates(subset=['time', 'state_abbr', 'variable'], keep='last')
+    # county (or other region) shapefiles name the region column after what it holds
+    region_column = config.get('region_column', 'state_abbr')
+    return typed_table(table.rename(columns={'state_abbr': region_column}), region_column)
+
+
+def typed_table(table, region_column='state_abbr'):
+    table = table.astype({region_column: 'category', 'variable': 'category', 'value': 'float32'})
+    table['time'] = pd.to_datetime(table['time'])
+    return table.sort_values(['variable', 'time', region_column]).reset_index(drop=True)
+
+
+def load_config(path=config_path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_table(path, region_column='state_abbr'):
+    # Read an engine output CSV back with its types (ids as strings, county GEOIDs keep their leading zero)
+    table = pd.read_csv(path, parse_dates=['time'], dtype={region_column: str})
+    return typed_table(table, region_column)
+
+
+if __name__ == '__main__':
+    # python Precipitation/netcdf_engine.py [config.json] [weighting]
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else config_path)
+    output = config['output']
+    scheme = sys.argv[2] if len(sys.argv) > 2 else None
+    if scheme and scheme != config.get('weighting', 'centroid'):
+        # other schemes go next to the default output instead of replacing it
+        output = output.replace('.csv', f'_{scheme}.csv')
+    table = run(config, scheme)
+    table.to_csv(output, index=False)
+    print(f"Saved {len(table)} rows ({table['variable'].nunique()} variables) to {output}")
@@ -1,48 +1,97 @@
 
 import numpy as np
-from datetime import datetime
+import pandas as pd
 
 # Load the GPCP precipitation data
 
 filepath = './gpcp_precip_cleaned.csv'
 
-gpcpPrecipData = np.genfromtxt(filepath, delimiter=',', dtype=None, encoding='utf-8', names=True)
-print(gpcpPrecipData.dtype.names)
-# Extract relevant columns
-dates = gpcpPrecipData['time']
-states = gpcpPrecipData['STATE_NAME']
-precip = gpcpPrecipData['precip']
-
-# Extract year from date strings
-years = np.array([datetime.strptime(date, '%Y-%m-%d').year for date in dates])
-
-# Unique states and years
-unique_states = np.unique(states)
-unique_years = np.unique(years)
-
-# Aggregate data: (state, year) → average precip
-aggregated = []
-for state in unique_states:
-    for year in unique_years:
-        mask = (states == state) & (years == year)
-        if np.any(mask):
-            avg = np.mean(precip[mask])
-            aggregated.append((state, year, avg))
-
-# Convert to structured array
-aggregated_array = np.array(
-    aggregated,
-    dtype=[('state', 'U30'), ('year', 'i4'), ('avg_precip', 'f4')]
-)
-
-# Save to CSV
-np.savetxt(
-    'gpcp_precip_aggregated_by_state_year.csv',
-    aggregated_array,
-    delimiter=',',
-    fmt='%s,%d,%.2f',
-    header='State,Year,AvgPrecip',
-    comments=''
-)
+# Aggregations: months per period and how far the period start is shifted back
+# from January (meteorological winter starts in December, the water year in October)
+aggregations = {
+    'Annual':  {'length': 12, 'shift': 0, 'labels': ['Annual']},
+    'Quarter': {'length': 3,  'shift': 0, 'labels': ['Q1', 'Q2', 'Q3', 'Q4']},
+    'Season':  {'length': 3,  'shift': 1, 'labels': ['DJF', 'MAM', 'JJA', 'SON']},
+    'WaterYear': {'length': 12, 'shift': 3, 'labels': ['WaterYear']},
+}
 
 
+def dense_state_year_month(data):
+    """
+    Reshape long (time, state_abbr, precip) rows into a dense
+    (state, year, month) array in one vectorized pass. Duplicate rows for the
+    same month (preliminary + final GPCP files) are averaged.
+    Returns (values, states, years) with NaN for missing months.
+    """
+    # one vectorized datetime64 parse instead of strptime per row
+    months = data['time'].to_numpy(dtype=str).astype('datetime64[M]')
+    month_number = months.astype(int)
+    year = month_number // 12 + 1970
+    month = month_number % 12
+
+    states, state_idx = np.unique(data['state_abbr'].to_numpy(dtype=str), return_inverse=True)
+    years = np.arange(year.min(), year.max() + 1)
+    shape = (len(states), len(years), 12)
+
+    flat = np.ravel_multi_index((state_idx, year - years[0], month), shape)
+    precip = data['precip'].to_numpy(dtype=float)
+    ok = ~np.isnan(precip)
+    sums = np.bincount(flat[ok], weights=precip[ok], minlength=np.prod(shape))
+    counts = np.bincount(flat[ok], minlength=np.prod(shape))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = np.where(counts > 0, sums / counts, np.nan)
+    return values.reshape(shape), states, years
+
+
+def period_means(values, length, shift, min_fraction=1.0):
+    """
+    Average a (state, year, 12) array over consecutive periods of `length`
+    months, starting `shift` months before January. Periods are labelled by
+    the year they end in (DJF 2019 = Dec 2018 - Feb 2019, water year 2019 =
+    Oct 2018 - Sep 2019). Periods with less than `min_fraction` of their
+    months present are NaN.
+    Returns an array of shape (state, year, 12 // length).
+    """
+    n_states, n_years, _ = values.shape
+    flat = values.reshape(n_states, n_years * 12)
+    shifted = np.concatenate([np.full((n_states, shift), np.nan), flat[:, :n_years * 12 - shift]], axis=1)
+    blocks = shifted.reshape(n_states, n_years, 12 // length, length)
+
+    present = (~np.isnan(blocks)).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nansum(blocks, axis=-1) / present
+    return np.where(present >= min_fraction * length, means, np.nan)
+
+
+def aggregate_all(data, min_fraction=1.0):
+    """
+    Calendar-year, quarterly, meteorological-season and water-year means for
+    every state from one dense array. Returns a long DataFrame with columns
+    State, Year, Aggregation, Period, AvgPrecip.
+    """
+    values, states, years = dense_state_year_month(data)
+
+    frames = []
+    for name, spec in aggregations.items():
+        means = period_means(values, spec['length'], spec['shift'], min_fraction)
+        n_periods = means.shape[-1]
+        frames.append(pd.DataFrame({
+            'State': np.repeat(states, len(years) * n_periods),
+            'Year': np.tile(np.repeat(years, n_periods), len(states)),
+            'Aggregation': name,
+            'Period': np.tile(spec['labels'], len(states) * len(years)),
+            'AvgPrecip': means.ravel(),
+        }))
+    return pd.concat(frames, ignore_index=True).dropna(subset=['AvgPrecip'])
+
+
+if __name__ == '__main__':
+    gpcpPrecipData = pd.read_csv(filepath)
+    aggregated = aggregate_all(gpcpPrecipData)
+
+    # Save all aggregations in one long table ...
+    aggregated.to_csv('gpcp_precip_aggregated_by_state_period.csv', index=False, float_format='%.2f')
+
+    # ... and the calendar-year means in the original State,Year,AvgPrecip layout
+    annual = aggregated[aggregated['Aggregation'] == 'Annual'][['State', 'Year', 'AvgPrecip']]
+    annual.to_csv('gpcp_precip_aggregated_by_state_year.csv', index=False, float_format='%.2f')
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import warnings
+
+from precip_aggregate import dense_state_year_month
+
+# Run from the repo root; the anomaly table is written next to gpcp_precip_cleaned.csv
+input_csv = './cleaningOutput/gpcp_precip_cleaned.csv'
+output_csv = './cleaningOutput/gpcp_precip_anomaly.csv'
+
+
+def climatology_and_anomalies(data):
+    """
+    Per-state monthly climatology (mean and standard deviation of each
+    calendar month across years) and the departures of every month from it.
+
+    Returns a long DataFrame with columns
+      time, state_abbr, precip, clim_mean, clim_std, anomaly, std_anomaly
+    where anomaly = precip - clim_mean and std_anomaly = anomaly / clim_std.
+    """
+    values, states, years = dense_state_year_month(data)
+
+    with warnings.catch_warnings():
+        # states with no data in a calendar month
+        warnings.simplefilter('ignore', RuntimeWarning)
+        clim_mean = np.nanmean(values, axis=1, keepdims=True)
+        clim_std = np.nanstd(values, axis=1, ddof=1, keepdims=True)
+    anomaly = values - clim_mean
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std_anomaly = np.where(clim_std > 0, anomaly / clim_std, np.nan)
+
+    months = (np.arange(len(years) * 12) + (years[0] - 1970) * 12).astype('datetime64[M]')
+    shape = values.shape
+    table = pd.DataFrame({
+        'time': np.tile(months.astype('datetime64[D]'), len(states)),
+        'state_abbr': np.repeat(states, len(months)),
+        'precip': values.ravel(),
+        'clim_mean': np.broadcast_to(clim_mean, shape).ravel(),
+        'clim_std': np.broadcast_to(clim_std, shape).ravel(),
+        'anomaly': anomaly.ravel(),
+        'std_anomaly': std_anomaly.ravel(),
+    })
+    return table.dropna(subset=['precip']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    anomalies = climatology_and_anomalies(pd.read_csv(input_csv))
+    anomalies.to_csv(output_csv, index=False, float_format='%.5f')
+    print(f"Saved {len(anomalies)} rows to {output_csv}")
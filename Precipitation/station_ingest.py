@@ -0,0 +1,141 @@
+import glob
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Paths relative to the repo root
+state_shapefile = './Precipitation/cb_2018_us_state_20m/cb_2018_us_state_20m.shp'
+county_shapefile = './Precipitation/cb_2018_us_county_20m/cb_2018_us_county_20m.shp'
+
+# Column names in the station CSVs (GHCN-style exports); override per call if different
+station_columns = {'station': 'STATION', 'time': 'DATE', 'latitude': 'LATITUDE',
+                   'longitude': 'LONGITUDE', 'precip': 'PRCP'}
+
+
+class RegionIndex:
+    """
+    STRtree over the polygons of one shapefile, built once and reused for
+    every batch of points. assign() does the point-in-polygon test for all
+    points in one vectorized query instead of a shapely Point per row + sjoin.
+    """
+
+    def __init__(self, shapefile_path, id_column):
+        import geopandas as gpd
+        import shapely
+        regions = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
+        self.regions = regions
+        self.ids = regions[id_column].to_numpy().astype(str)
+        self.tree = shapely.STRtree(regions.geometry.to_numpy())
+
+    def assign(self, longitude, latitude):
+        # index of the polygon containing each point, -1 for points outside every polygon
+        import shapely
+        points = shapely.points(longitude, latitude)
+        point_idx, region_idx = self.tree.query(points, predicate='intersects')
+        result = np.full(len(points), -1)
+        # a point on a shared border touches two polygons; keep the first
+        result[point_idx[::-1]] = region_idx[::-1]
+        return result
+
+
+def read_stations(files, columns=station_columns):
+    # Concatenate station CSVs, keeping only the columns we need
+    usecols = list(columns.values())
+    frames = [pd.read_csv(path, usecols=usecols) for path in sorted(glob.glob(files))]
+    table = pd.concat(frames, ignore_index=True).rename(columns={v: k for k, v in columns.items()})
+    return table.dropna(subset=['latitude', 'longitude', 'precip'])
+
+
+def region_means(time, station_mean, station_region, ids, column):
+    # region-month means of the station-month means, skipping stations outside every region
+    inside = station_region >= 0
+    groups = pd.DataFrame({'time': time[inside], column: ids[station_region[inside]],
+                           'precip': station_mean[inside]})
+    return groups.groupby(['time', column], sort=True, observed=True)['precip'].mean().reset_index()
+
+
+def aggregate_stations(stations, states, counties=None):
+    """
+    Monthly precipitation per state (and optionally per county) from station
+    readings.
+
+    Stations report from the same place every day/month, so the
+    point-in-polygon test runs once per distinct location, not once per row.
+    Readings are first averaged per station and month, then the station means
+    are averaged per region, so a station reporting daily does not outweigh
+    one reporting a few times a month.
+
+    stations : DataFrame with station, time, latitude, longitude, precip
+    states   : RegionIndex over the state shapefile (ids = STUSPS)
+    counties : optional RegionIndex over a county shapefile (ids = GEOID)
+
+    Returns (time, state_abbr, precip) like gpcp_precip_cleaned.csv. When
+    counties are given, returns (state table, county table); the county table
+    has time, state_abbr, county, precip. Each table uses its own mask, so a
+    station that is in a state but in no county still counts for the state.
+    Empty tables come back when no station falls inside any region.
+    """
+    state_columns = ['time', 'state_abbr', 'precip']
+    county_columns = ['time', 'state_abbr', 'county', 'precip']
+    empty = pd.DataFrame({'time': pd.Series(dtype='datetime64[s]'), 'state_abbr': pd.Series(dtype=str),
+                          'county': pd.Series(dtype=str), 'precip': pd.Series(dtype=float)})
+    empty_result = (empty[state_columns], empty[county_columns]) if counties is not None else empty[state_columns]
+    if stations.empty:
+        return empty_result
+
+    # distinct locations -> region, one bulk STRtree query
+    location_idx = stations.groupby(['longitude', 'latitude'], sort=False).ngroup().to_numpy()
+    locations = np.zeros((location_idx.max() + 1, 2))
+    locations[location_idx] = stations[['longitude', 'latitude']].to_numpy(dtype=float)
+    state_idx = states.assign(locations[:, 0], locations[:, 1])[location_idx]
+    if counties is not None:
+        county_idx = counties.assign(locations[:, 0], locations[:, 1])[location_idx]
+    else:
+        county_idx = np.full_like(state_idx, -1)
+
+    # rows inside a state or a county; each table below filters on its own index
+    keep = (state_idx >= 0) | (county_idx >= 0)
+    if not keep.any():
+        return empty_result
+    month = stations['time'].to_numpy(dtype=str).astype('datetime64[M]').astype(np.int64)[keep]
+    station_code = pd.factorize(stations['station'])[0][keep]
+
+    # station-month means
+    n_months = month.max() - month.min() + 1
+    first, station_month = pd.factorize(station_code * n_months + (month - month.min()))
+    precip = stations['precip'].to_numpy(dtype=float)[keep]
+    station_mean = np.bincount(first, weights=precip) / np.bincount(first)
+    station_state = np.zeros(len(station_month), dtype=np.int64)
+    station_state[first] = state_idx[keep]
+    station_county = np.zeros(len(station_month), dtype=np.int64)
+    station_county[first] = county_idx[keep]
+    time = (station_month % n_months + month.min()).astype('datetime64[M]').astype('datetime64[D]')
+
+    state_table = region_means(time, station_mean, station_state, states.ids, 'state_abbr')
+    if counties is None:
+        return state_table[state_columns]
+    county_table = region_means(time, station_mean, station_county, counties.ids, 'county')
+    # a county's state is the state its GEOID starts with (first two digits = state FIPS)
+    county_state = counties.regions.set_index(counties.ids)['STATEFP']
+    state_fips = states.regions.set_index('STATEFP')['STUSPS']
+    county_table['state_abbr'] = state_fips.reindex(county_state.reindex(county_table['county'])).to_numpy()
+    return state_table[state_columns], county_table[county_columns]
+
+
+if __name__ == '__main__':
+    # python Precipitation/station_ingest.py "stations/*.csv" output.csv [county]
+    files, output = sys.argv[1], sys.argv[2]
+    states = RegionIndex(state_shapefile, 'STUSPS')
+    counties = RegionIndex(county_shapefile, 'GEOID') if 'county' in sys.argv[3:] else None
+    result = aggregate_stations(read_stations(files), states, counties)
+    if counties is not None:
+        # state means go to the given path, county means next to it
+        state_table, county_table = result
+        county_output = output.replace('.csv', '_county.csv')
+        county_table.to_csv(county_output, index=False)
+        print(f"Saved {len(county_table)} rows to {county_output}")
+    else:
+        state_table = result
+    state_table.to_csv(output, index=False)
+    print(f"Saved {len(state_table)} rows to {output}")
@@ -0,0 +1,115 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis_files.cube import by_year
+
+
+def _pearson(x, y, min_periods=4):
+    # Pearson r along the last axis, skipping positions where either side is NaN
+    valid = ~(np.isnan(x) | np.isnan(y))
+    n = valid.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x, 0.0).sum(axis=-1) / n
+        y_mean = np.where(valid, y, 0.0).sum(axis=-1) / n
+        dx = np.where(valid, x - x_mean[..., None], 0.0)
+        dy = np.where(valid, y - y_mean[..., None], 0.0)
+        r = (dx * dy).sum(axis=-1) / np.sqrt((dx ** 2).sum(axis=-1) * (dy ** 2).sum(axis=-1))
+    return np.where(n >= min_periods, r, np.nan), n
+
+
+def _rank(a, valid):
+    # Average ranks along the last axis (ties share the mean rank), NaN where invalid.
+    # The axis is short (12 months), so a pairwise comparison is cheaper than sorting.
+    a_i = a[..., :, None]
+    a_j = a[..., None, :]
+    v_j = valid[..., None, :]
+    below = ((a_j < a_i) & v_j).sum(axis=-1)
+    equal = ((a_j == a_i) & v_j).sum(axis=-1)
+    return np.where(valid, below + (equal + 1) / 2.0, np.nan)
+
+
+def _spearman(x, y, min_periods=4):
+    valid = ~(np.isnan(x) | np.isnan(y))
+    return _pearson(_rank(x, valid), _rank(y, valid), min_periods)
+
+
+METHODS = {'pearson': _pearson, 'spearman': _spearman}
+
+
+def _bootstrap_chunk(args):
+    # Resample months with replacement and recompute every state-year at once.
+    # Returns an array of shape (len(methods), n_resamples, S, Y).
+    x, y, methods, n_resamples, seed = args
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, x.shape[-1], size=(n_resamples, x.shape[-1]))
+    xb = np.moveaxis(x[..., idx], -2, 0)
+    yb = np.moveaxis(y[..., idx], -2, 0)
+    return np.stack([METHODS[m](xb, yb)[0] for m in methods])
+
+
+def bootstrap_ci(x, y, methods=('pearson', 'spearman'), n_resamples=1000, ci=0.95,
+                 n_jobs=None, chunk_size=100, seed=0):
+    """
+    Percentile bootstrap confidence intervals for each correlation method.
+
+    The resamples are split into chunks of `chunk_size`; each chunk is evaluated
+    as one batched array operation in a worker process. Set n_jobs=1 to run
+    in-process (e.g. when a process pool is not available).
+    Returns {method: (low, high)} with arrays shaped like x[..., 0].
+    """
+    n_chunks = max(1, int(np.ceil(n_resamples / chunk_size)))
+    sizes = np.diff(np.linspace(0, n_resamples, n_chunks + 1).astype(int))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    tasks = [(x, y, tuple(methods), int(n), s) for n, s in zip(sizes, seeds)]
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or n_chunks == 1:
+        results = [_bootstrap_chunk(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, n_chunks)) as pool:
+            results = list(pool.map(_bootstrap_chunk, tasks))
+    samples = np.concatenate(results, axis=1)
+
+    alpha = (1 - ci) / 2
+    with warnings.catch_warnings():
+        # all-NaN slices (state-years without data) are expected here
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(samples, [alpha, 1 - alpha], axis=1)
+    return {m: (low[i], high[i]) for i, m in enumerate(methods)}
+
+
+def correlate_by_state_year(cube, methods=('pearson', 'spearman'), n_resamples=1000,
+                            ci=0.95, n_jobs=None, seed=0):
+    """
+    Correlate monthly precipitation with mean MENTHLTH for every state and year
+    at once, using a cube from analysis_files.cube.build_monthly_cube.
+
+    Returns a long DataFrame with columns
+      State, Year, Method, r, CI_Low, CI_High, N
+    where N is the number of months with both values present.
+    """
+    x, years = by_year(cube['precip'], cube['months'])
+    y, _ = by_year(cube['mh_mean'], cube['months'])
+
+    if n_resamples:
+        intervals = bootstrap_ci(x, y, methods, n_resamples, ci, n_jobs, seed=seed)
+
+    frames = []
+    for method in methods:
+        r, n = METHODS[method](x, y)
+        low, high = intervals[method] if n_resamples else (np.full_like(r, np.nan),) * 2
+        low, high = np.where(np.isnan(r), np.nan, low), np.where(np.isnan(r), np.nan, high)
+        frames.append(pd.DataFrame({
+            'State': np.repeat(cube['states'], len(years)),
+            'Year': np.tile(years, len(cube['states'])),
+            'Method': method,
+            'r': r.ravel(),
+            'CI_Low': low.ravel(),
+            'CI_High': high.ravel(),
+            'N': n.ravel(),
+        }))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,262 @@
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# BRFSS health metrics kept by the cleaning script, in the order of the cube's metric axis.
+# MENTHLTH comes first and is also stored as the mh_* arrays. `valid` is the range of real
+# answers (GENHLTH is a 1-5 scale; 7 and 9 are "don't know" / "refused")
+metrics = {
+    'MENTHLTH': {'label': 'Poor Mental Health Days', 'short': 'Poor MH Days', 'valid': (1, 30)},
+    'PHYSHLTH': {'label': 'Poor Physical Health Days', 'short': 'Poor PH Days', 'valid': (1, 30)},
+    'POORHLTH': {'label': 'Days Poor Health Limited Activities', 'short': 'Limited Activity Days', 'valid': (1, 30)},
+    'GENHLTH': {'label': 'General Health (1 = excellent, 5 = poor)', 'short': 'General Health', 'valid': (1, 5)},
+}
+
+
+def month_index(years, months):
+    # Convert integer year / month arrays into numpy datetime64[M] values
+    years = np.asarray(years).astype(int)
+    months = np.asarray(months).astype(int)
+    return ((years - 1970) * 12 + (months - 1)).astype('datetime64[M]')
+
+
+def state_month_grid(df, column, states, months):
+    """
+    Scatter long (time, state_abbr, <column>) rows onto a dense (S, T) grid
+    with the given state and month axes, averaging duplicate rows.
+    Rows outside the axes are ignored; empty cells are NaN.
+    """
+    n_states, n_months = len(states), len(months)
+    row_months = pd.to_datetime(df['time']).to_numpy().astype('datetime64[M]')
+    abbr = df['state_abbr'].to_numpy().astype(str)
+    state = np.searchsorted(states, abbr).clip(max=n_states - 1)
+    month = (row_months - months[0]).astype(int)
+    values = df[column].to_numpy(dtype=float)
+    keep = (states[state] == abbr) & (month >= 0) & (month < n_months) & ~np.isnan(values)
+
+    flat = state[keep] * n_months + month[keep]
+    sums = np.bincount(flat, weights=values[keep], minlength=n_states * n_months)
+    counts = np.bincount(flat, minlength=n_states * n_months)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid = np.where(counts > 0, sums / counts, np.nan)
+    return grid.reshape(n_states, n_months)
+
+
+def build_monthly_cube(precipitation_df, mental_health_df, decoder_df):
+    """
+    Aggregate GPCP precipitation and respondent-level BRFSS rows onto one dense
+    state x month grid in a single vectorized pass (no per-state loops).
+
+    Returns a dict of numpy arrays:
+      • states       : (S,) two-letter state codes, sorted
+      • months       : (T,) contiguous datetime64[M] axis
+      • precip       : (S, T) mean precipitation (mm/day), NaN where missing
+      • mh_sum       : (S, T) sum of MENTHLTH over respondents
+      • mh_count     : (S, T) number of respondents
+      • mh_mean      : (S, T) mean MENTHLTH, NaN where there are no respondents
+      • metrics      : (M,) names of the BRFSS metrics in the data (see `metrics`)
+      • metric_sum   : (S, T, M) sum of each metric over respondents with a valid answer
+      • metric_count : (S, T, M) number of those respondents
+      • metric_mean  : (S, T, M) mean of each metric
+    All metrics are aggregated together in one bincount over a flattened
+    (state, month, metric) index; use select_metric to point mh_* at another one.
+    """
+    states = np.unique(decoder_df['Abbreviation'].to_numpy(dtype=str))
+
+    # FIPS code -> position on the state axis (-1 for codes we do not map)
+    fips = decoder_df['_STATE'].to_numpy().astype(int)
+    fips_lut = np.full(256, -1)
+    fips_lut[fips] = np.searchsorted(states, decoder_df['Abbreviation'].to_numpy())
+
+    # Monthly time stamps for both sources
+    precip_months = pd.to_datetime(precipitation_df['time']).to_numpy().astype('datetime64[M]')
+    mh_months = month_index(mental_health_df['IYEAR'], mental_health_df['IMONTH'])
+    months = np.arange(min(precip_months.min(), mh_months.min()),
+                       max(precip_months.max(), mh_months.max()) + 1)
+    n_states, n_months = len(states), len(months)
+
+    # --- precipitation: one value per state-month (rows repeating a state and month are averaged) ---
+    precip = state_month_grid(precipitation_df, 'precip', states, months)
+
+    # --- health metrics: respondent sums and counts per state-month-metric ---
+    names = np.array([name for name in metrics if name in mental_health_df.columns])
+    n_metrics = len(names)
+    mh_fips = mental_health_df['_STATE'].to_numpy().astype(float).astype(int)
+    mh_state = fips_lut[mh_fips]
+    values = mental_health_df[list(names)].to_numpy(dtype=float)
+    low = np.array([metrics[name]['valid'][0] for name in names])
+    high = np.array([metrics[name]['valid'][1] for name in names])
+    # (N, M) mask of the answers that count; NaN compares False, so missing answers drop out too
+    keep = (mh_state >= 0)[:, None] & (values >= low) & (values <= high)
+    row_cell = mh_state * n_months + (mh_months - months[0]).astype(int)
+    flat = (row_cell[:, None] * n_metrics + np.arange(n_metrics))[keep]
+    size = n_states * n_months * n_metrics
+    metric_sum = np.bincount(flat, weights=values[keep], minlength=size)
+    metric_count = np.bincount(flat, minlength=size)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metric_mean = np.where(metric_count > 0, metric_sum / metric_count, np.nan)
+
+    shape = (n_states, n_months, n_metrics)
+    cube = {
+        'states': states,
+        'months': months,
+        'precip': precip,
+        'metrics': names,
+        'metric_sum': metric_sum.reshape(shape),
+        'metric_count': metric_count.reshape(shape),
+        'metric_mean': metric_mean.reshape(shape),
+    }
+    # MENTHLTH as the plain (S, T) arrays every analysis reads
+    return dict(cube, **{key: np.ascontiguousarray(value) for key, value in select_metric(cube, 'MENTHLTH').items()
+                         if key.startswith('mh_')})
+
+
+def select_metric(cube, metric):
+    """
+    The cube (or its prefix sums) with mh_sum / mh_count / mh_mean taken
+    from `metric`'s slice of the metric_* arrays. The slices are views, so
+    switching metrics recomputes nothing, and every function written against
+    mh_mean (correlations, lags, sensitivity, annual means, ...) works on any
+    metric.
+    """
+    i = list(cube['metrics']).index(metric)
+    return dict(cube, **{'mh_' + key: cube['metric_' + key][..., i]
+                         for key in ('sum', 'count', 'mean') if 'metric_' + key in cube})
+
+
+def by_year(values, months):
+    """
+    Reshape a (..., T) monthly array into (..., Y, 12) calendar-year blocks,
+    padding with NaN so the axis starts in January and ends in December.
+    Returns (blocks, years).
+    """
+    first = months[0].astype(int) % 12
+    last = months[-1].astype(int) % 12
+    pad = [(0, 0)] * (values.ndim - 1) + [(first, 11 - last)]
+    padded = np.pad(values.astype(float), pad, constant_values=np.nan)
+    years = np.arange(months[0].astype('datetime64[Y]').astype(int) + 1970,
+                      months[-1].astype('datetime64[Y]').astype(int) + 1971)
+    return padded.reshape(values.shape[:-1] + (len(years), 12)), years
+
+
+def annual_means(cube):
+    """
+    Calendar-year state means from a monthly cube. MENTHLTH is pooled over
+    respondents (sum / count), precipitation is the mean of the monthly values.
+    Returns ({'precip': (S, Y), 'mh_mean': (S, Y)}, years), plus
+    'metric_mean': (S, Y, M) for every metric when the cube has them.
+    """
+    precip, years = by_year(cube['precip'], cube['months'])
+    mh_sum, _ = by_year(cube['mh_sum'], cube['months'])
+    mh_count, _ = by_year(cube['mh_count'], cube['months'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        precip_mean = np.nanmean(precip, axis=-1)
+        mh_mean = np.nansum(mh_sum, axis=-1) / np.nansum(mh_count, axis=-1)
+        means = {'precip': precip_mean, 'mh_mean': mh_mean}
+        if 'metric_sum' in cube:
+            # month axis last for by_year: (S, M, T) -> (S, M, Y, 12), then back to (S, Y, M)
+            metric_sum, _ = by_year(np.moveaxis(cube['metric_sum'], 2, 1), cube['months'])
+            metric_count, _ = by_year(np.moveaxis(cube['metric_count'], 2, 1), cube['months'])
+            means['metric_mean'] = np.moveaxis(np.nansum(metric_sum, axis=-1) / np.nansum(metric_count, axis=-1), 1, 2)
+    return means, years
+
+
+def prefix_sums(cube):
+    """
+    Cumulative sums along the month axis with a leading zero column, so the
+    total over months [i, j] of any state is  C[:, j + 1] - C[:, i].
+
+    Returns a dict with the cube's states / months plus (S, T + 1) arrays
+    precip_sum, precip_count, mh_sum and mh_count, and (S, T + 1, M)
+    metric_sum / metric_count when the cube has metrics (see select_metric).
+    """
+    precip = cube['precip']
+    sums = {
+        'precip_sum': np.nan_to_num(precip),
+        'precip_count': (~np.isnan(precip)).astype(float),
+        'mh_sum': cube['mh_sum'].astype(float),
+        'mh_count': cube['mh_count'].astype(float),
+    }
+    if 'metric_sum' in cube:
+        sums['metric_sum'] = cube['metric_sum'].astype(float)
+        sums['metric_count'] = cube['metric_count'].astype(float)
+    prefix = {key: np.pad(np.cumsum(values, axis=1), [(0, 0), (1, 0)] + [(0, 0)] * (values.ndim - 2))
+              for key, values in sums.items()}
+    prefix['states'] = cube['states']
+    prefix['months'] = cube['months']
+    if 'metrics' in cube:
+        prefix['metrics'] = cube['metrics']
+    return prefix
+
+
+def range_means(prefix, ranges):
+    """
+    Per-state means over one or more inclusive month ranges, two lookups per
+    range in the prefix-sum cube.
+
+    ranges : list of (start, end) pairs, anything np.datetime64(..., 'M') accepts
+    Returns {'precip': (S,), 'mh_mean': (S,), 'mh_count': (S,)}.
+    """
+    months = prefix['months']
+    starts = np.array([np.datetime64(start, 'M') for start, _ in ranges])
+    ends = np.array([np.datetime64(end, 'M') for _, end in ranges])
+    lo = np.clip((starts - months[0]).astype(int), 0, len(months))
+    hi = np.clip((ends - months[0]).astype(int) + 1, 0, len(months))
+    hi = np.maximum(hi, lo)
+
+    total = {key: (prefix[key][:, hi] - prefix[key][:, lo]).sum(axis=1)
+             for key in ('precip_sum', 'precip_count', 'mh_sum', 'mh_count')}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'precip': total['precip_sum'] / total['precip_count'],
+            'mh_mean': total['mh_sum'] / total['mh_count'],
+            'mh_count': total['mh_count'],
+        }
+
+
+def season_ranges(start, end, months_of_year):
+    """
+    Split [start, end] into the contiguous runs of months whose calendar month
+    (1-12) is in `months_of_year`, e.g. (12, 1, 2) gives every winter.
+    """
+    months = np.arange(np.datetime64(start, 'M'), np.datetime64(end, 'M') + 1)
+    selected = np.isin(months.astype(int) % 12 + 1, months_of_year)
+    edges = np.diff(np.concatenate([[0], selected.astype(int), [0]]))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1) - 1
+    return list(zip(months[run_starts], months[run_ends]))
+
+
+def save_cube(cube, path, sources=None):
+    # sources: {dataset: content hash} of the inputs, stored so readers can tell whether the file is current
+    arrays = {key: (value.astype(str) if key == 'months' else value) for key, value in cube.items()}
+    if sources:
+        arrays['sources'] = np.array(json.dumps(sources, sort_keys=True))
+    np.savez_compressed(path, **arrays)
+
+
+def load_cube(path):
+    with np.load(path) as data:
+        cube = {key: data[key] for key in data.files if key != 'sources'}
+    cube['months'] = cube['months'].astype('datetime64[M]')
+    cube['states'] = cube['states'].astype(str)
+    if 'metrics' in cube:
+        cube['metrics'] = cube['metrics'].astype(str)
+    return cube
+
+
+if __name__ == '__main__':
+    # Build the monthly cube and its prefix sums from the cleaned CSVs (run from the repo root)
+    cube = build_monthly_cube(pd.read_csv('./cleaningOutput/gpcp_precip_cleaned.csv'),
+                              pd.read_csv('./cleaningOutput/combined_mental_health_data.csv'),
+                              pd.read_csv('./cleaningOutput/state_codes.csv'))
+    from catalog_files.catalog import source_hashes, update_catalog
+    sources = source_hashes('monthly_cube')
+    save_cube(cube, './cleaningOutput/monthly_cube.npz', sources)
+    save_cube(prefix_sums(cube), './cleaningOutput/monthly_cube_prefix.npz', sources)
+    print("Saved monthly cube and prefix sums to ./cleaningOutput")
+    update_catalog()
@@ -0,0 +1,78 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis_files.cube import by_year
+
+
+def remove_seasonal_cycle(values, months):
+    # Subtract each state's mean for the calendar month (Jan, Feb, ...) across years
+    blocks, _ = by_year(values, months)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        climatology = np.nanmean(blocks, axis=-2, keepdims=True)
+    anomalies = (blocks - climatology).reshape(values.shape[:-1] + (-1,))
+    first = months[0].astype(int) % 12
+    return anomalies[..., first:first + values.shape[-1]]
+
+
+def _cross_sums(f_hat, g_hat, n_fft, max_lag):
+    # sum_t f[t] * g[t + k] for k = 0..max_lag, for every row at once
+    return np.fft.irfft(np.conj(f_hat) * g_hat, n=n_fft, axis=-1)[..., :max_lag + 1]
+
+
+def lagged_correlation(x, y, max_lag=6, min_periods=12):
+    """
+    Pearson correlation between x[t] and y[t + k] for k = 0..max_lag along the
+    last axis, computed for all rows (states) at once with FFT cross-correlations.
+
+    NaNs are handled exactly: every sum (pair count, sums, sums of squares and
+    cross products) is its own masked cross-correlation, so each lag only uses
+    the months where both series are present.
+    Returns (r, n), both shaped (..., max_lag + 1).
+    """
+    mx = ~np.isnan(x)
+    my = ~np.isnan(y)
+    x0 = np.where(mx, x, 0.0)
+    y0 = np.where(my, y, 0.0)
+
+    # zero-pad to avoid circular wrap-around
+    n_fft = 2 * x.shape[-1]
+    fft = lambda a: np.fft.rfft(a, n=n_fft, axis=-1)
+    mx_hat, x_hat, xx_hat = fft(mx.astype(float)), fft(x0), fft(x0 ** 2)
+    my_hat, y_hat, yy_hat = fft(my.astype(float)), fft(y0), fft(y0 ** 2)
+
+    n = np.rint(_cross_sums(mx_hat, my_hat, n_fft, max_lag))
+    sx = _cross_sums(x_hat, my_hat, n_fft, max_lag)
+    sy = _cross_sums(mx_hat, y_hat, n_fft, max_lag)
+    sxx = _cross_sums(xx_hat, my_hat, n_fft, max_lag)
+    syy = _cross_sums(mx_hat, yy_hat, n_fft, max_lag)
+    sxy = _cross_sums(x_hat, y_hat, n_fft, max_lag)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+    r = np.where(n >= min_periods, np.clip(r, -1, 1), np.nan)
+    return r, n.astype(int)
+
+
+def lag_correlations(cube, max_lag=6, deseasonalize=False):
+    """
+    Correlate precipitation in month t with mean MENTHLTH in month t + lag for
+    every state, using a cube from analysis_files.cube.build_monthly_cube.
+
+    Returns a long DataFrame with columns State, Lag, r, N.
+    """
+    x, y = cube['precip'], cube['mh_mean']
+    if deseasonalize:
+        x = remove_seasonal_cycle(x, cube['months'])
+        y = remove_seasonal_cycle(y, cube['months'])
+
+    r, n = lagged_correlation(x, y, max_lag)
+    lags = np.arange(max_lag + 1)
+    return pd.DataFrame({
+        'State': np.repeat(cube['states'], len(lags)),
+        'Lag': np.tile(lags, len(cube['states'])),
+        'r': r.ravel(),
+        'N': n.ravel(),
+    })
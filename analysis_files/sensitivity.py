@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+def _design(x, months):
+    # Columns: precip slope, then one dummy per calendar month (these replace the intercept)
+    month_of_year = months.astype(int) % 12
+    dummies = np.broadcast_to(np.eye(12)[month_of_year], x.shape + (12,))
+    return np.concatenate([x[..., None], dummies], axis=-1)
+
+
+def fit_sensitivity(cube, start=None, end=None, min_months=18):
+    """
+    Regress monthly mean MENTHLTH on precipitation for every state, with
+    month-of-year fixed effects so the seasonal cycle does not drive the slope.
+
+    All state models are solved together: months with a missing value are
+    zeroed out of the stacked (S, T, 13) design, and the normal equations are
+    solved with one batched pseudo-inverse (which also copes with states that
+    never report a given calendar month).
+
+    start / end : optional inclusive bounds, anything np.datetime64(..., 'M') accepts
+    Returns a DataFrame with columns State, Slope, SE, T, N.
+    """
+    months = cube['months']
+    keep = np.ones(len(months), dtype=bool)
+    if start is not None:
+        keep &= months >= np.datetime64(start, 'M')
+    if end is not None:
+        keep &= months <= np.datetime64(end, 'M')
+
+    x = cube['precip'][:, keep]
+    y = cube['mh_mean'][:, keep]
+    valid = ~(np.isnan(x) | np.isnan(y))
+
+    X = np.where(valid[..., None], _design(np.nan_to_num(x), months[keep]), 0.0)
+    Y = np.where(valid, y, 0.0)
+
+    XtX = np.einsum('stk,stl->skl', X, X)
+    XtY = np.einsum('stk,st->sk', X, Y)
+    XtX_inv = np.linalg.pinv(XtX, hermitian=True)
+    beta = np.einsum('skl,sl->sk', XtX_inv, XtY)
+
+    resid = np.where(valid, Y - np.einsum('stk,sk->st', X, beta), 0.0)
+    n = valid.sum(axis=1)
+    dof = n - np.linalg.matrix_rank(XtX, hermitian=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = (resid ** 2).sum(axis=1) / dof
+        se = np.sqrt(sigma2 * XtX_inv[:, 0, 0])
+        slope = np.where((n >= min_months) & (dof > 0), beta[:, 0], np.nan)
+        se = np.where(np.isnan(slope), np.nan, se)
+        t = slope / se
+
+    return pd.DataFrame({
+        'State': cube['states'],
+        'Slope': slope,
+        'SE': se,
+        'T': t,
+        'N': n,
+    })
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+SHAPEFILE_PATH = './Precipitation/cb_2018_us_state_20m/cb_2018_us_state_20m.shp'
+ADJACENCY_CACHE = './cleaningOutput/state_adjacency.npz'
+
+
+def build_adjacency(states, shapefile_path=SHAPEFILE_PATH, cache_path=ADJACENCY_CACHE):
+    """
+    Binary queen-contiguity matrix (states sharing a border or a corner) as a
+    scipy CSR matrix ordered like `states`.
+
+    Neighbour pairs are found once with the shapefile's spatial index and
+    stored in `cache_path`; later calls only read the cached edge list.
+    """
+    states = np.asarray(states).astype(str)
+
+    if cache_path and os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        codes, i, j = cached['states'].astype(str), cached['i'], cached['j']
+    else:
+        import geopandas as gpd
+        shapes = gpd.read_file(shapefile_path)
+        i, j = shapes.sindex.query(shapes.geometry, predicate='touches')
+        codes = shapes['STUSPS'].to_numpy().astype(str)
+        if cache_path:
+            np.savez_compressed(cache_path, states=codes, i=i, j=j)
+
+    # re-index the cached edges onto the requested state order
+    position = {code: k for k, code in enumerate(states)}
+    src = np.array([position.get(code, -1) for code in codes[i]])
+    dst = np.array([position.get(code, -1) for code in codes[j]])
+    keep = (src >= 0) & (dst >= 0)
+    n = len(states)
+    return sparse.csr_matrix((np.ones(keep.sum()), (src[keep], dst[keep])), shape=(n, n))
+
+
+def _row_standardize(W):
+    degree = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(1.0, degree, out=np.zeros_like(degree), where=degree > 0)
+    return sparse.diags(scale) @ W
+
+
+def morans_i(states, values, W, n_permutations=999, alpha=0.05, seed=0):
+    """
+    Global and local (LISA) Moran's I for one value per state, with W from
+    build_adjacency(states).
+
+    States with a missing value are dropped together with their edges; states
+    without neighbours (AK, HI) get no local statistic. Significance comes
+    from random permutations of the values: for the global I all permutations
+    are stacked into one (n, n_permutations) matrix and their spatial lags are
+    computed with a single sparse matrix product; for the local I each state
+    keeps its own value and only the other n - 1 values are permuted over its
+    neighbours (conditional randomization), drawn for all states at once.
+
+    Returns (global_result, local_df):
+      global_result : dict with I, expected I, pseudo p-value and n
+      local_df      : one row per state with State, Value, Lag, Local_I, P, Cluster
+    """
+    values = np.asarray(values, dtype=float)
+    keep = ~np.isnan(values)
+    W = _row_standardize(W.tocsr()[keep][:, keep])
+    has_neighbours = np.asarray(W.sum(axis=1)).ravel() > 0
+
+    x = values[keep]
+    n = len(x)
+    z = (x - x.mean()) / x.std()
+    m2 = (z ** 2).sum() / n
+    s0 = W.sum()
+
+    lag = W @ z
+    I = (n / s0) * (z @ lag) / (z @ z)
+    local = z * lag / m2
+
+    # global permutation inference, one sparse product for every permutation
+    rng = np.random.default_rng(seed)
+    z_perm = rng.permuted(np.tile(z[:, None], (1, n_permutations)), axis=0)
+    lag_perm = W @ z_perm
+    I_perm = (n / s0) * (z_perm * lag_perm).sum(axis=0) / (z @ z)
+
+    # local (conditional) permutations: z_i stays fixed and its neighbours get values drawn
+    # without replacement from the other n - 1 states, so a state never lands in its own lag
+    degree = np.diff(W.indptr)
+    k_max = max(int(degree.max()), 1)
+    slot = np.arange(k_max)
+    # (n, k_max) neighbour weights of each row, zero-padded past the row's degree
+    weights = np.zeros((n, k_max))
+    used = slot < degree[:, None]
+    weights[used] = W.data
+    others = np.delete(np.tile(z, (n, 1)), np.arange(n) * (n + 1)).reshape(n, n - 1)
+    drawn = rng.permuted(np.broadcast_to(others, (n_permutations, n, n - 1)), axis=-1)[..., :k_max]
+    local_lag_perm = (drawn * weights).sum(axis=-1).T
+    local_perm = z[:, None] * local_lag_perm / m2
+
+    if I >= I_perm.mean():
+        p_global = ((I_perm >= I).sum() + 1) / (n_permutations + 1)
+    else:
+        p_global = ((I_perm <= I).sum() + 1) / (n_permutations + 1)
+    upper = (local_perm >= local[:, None]).sum(axis=1)
+    lower = (local_perm <= local[:, None]).sum(axis=1)
+    p_local = (np.minimum(upper, lower) + 1) / (n_permutations + 1)
+
+    quadrant = np.select([(z > 0) & (lag > 0), (z < 0) & (lag < 0), (z > 0) & (lag < 0), (z < 0) & (lag > 0)],
+                         ['High-High', 'Low-Low', 'High-Low', 'Low-High'], default='Not significant')
+    cluster = np.where((p_local < alpha) & has_neighbours, quadrant, 'Not significant')
+
+    local_df = pd.DataFrame({'State': states, 'Value': values,
+                             'Lag': np.nan, 'Local_I': np.nan, 'P': np.nan, 'Cluster': None})
+    local_df.loc[keep, 'Lag'] = np.where(has_neighbours, lag, np.nan)
+    local_df.loc[keep, 'Local_I'] = np.where(has_neighbours, local, np.nan)
+    local_df.loc[keep, 'P'] = np.where(has_neighbours, p_local, np.nan)
+    local_df.loc[keep, 'Cluster'] = cluster
+
+    global_result = {'I': I, 'Expected_I': -1.0 / (n - 1), 'P': p_global, 'N': n}
+    return global_result, local_df
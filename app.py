@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from scatterplot_files.scatterplot import ScatterplotVisualizer
-from choropleth_files.choropleth import choropleth_combined, choropleth_mental, choropleth_precip
+from scatterplot_files.scatterplot import ScatterplotVisualizer, anomaly_scatter
+from choropleth_files.choropleth import yearly_tables, choropleth_combined, choropleth_mental, choropleth_precip, choropleth_correlation, choropleth_sensitivity, add_lisa_overlay, choropleth_date_range, choropleth_anomaly, choropleth_county, choropleth_precip_aggregate, period_names
+import os
+import json
+from Precipitation.precip_aggregate import aggregate_all
+from analysis_files.cube import build_monthly_cube, annual_means, load_cube, prefix_sums, range_means, season_ranges, state_month_grid, metrics, select_metric
+from analysis_files.correlation import correlate_by_state_year
+from analysis_files.lag import lag_correlations
+from analysis_files.sensitivity import fit_sensitivity
+from analysis_files.spatial import build_adjacency, morans_i
+from heatmap_files.heatmap import lag_heatmap, state_month_heatmap
+from figure_files.payload import figure_spec, SpecFigure
+from geometry_files.geometry import build_geojson, county_shapefile, county_geojson
+from catalog_files.catalog import is_current
+from catalog_files.watcher import DataWatcher
 
 # Title
 st.title("CS5764 Final Project: How does Weather Impact Mental Health")
@@ -11,63 +25,371 @@ st.title("CS5764 Final Project: How does Weather Impact Mental Health")
 # Sidebar for user interaction
 chart_type = st.sidebar.selectbox("Select Visualization", [
                                                            "Choropleth - Precipitation", 
+                                                           "Choropleth - Precipitation Period",
                                                            "Choropleth - Mental Health", 
                                                            "Choropleth - Combined",
-                                                           "Monthly Precipitation"
+                                                           "Choropleth - Date Range",
+                                                           "Choropleth - Precipitation Anomaly",
+                                                           "Choropleth - County Precipitation",
+                                                           "Choropleth - Correlation",
+                                                           "Choropleth - Precipitation Sensitivity",
+                                                           "Heatmap - Lagged Correlation",
+                                                           "Heatmap - All States by Month",
+                                                           "Monthly Precipitation",
+                                                           "Precipitation Anomaly vs. Mental Health"
                                                            ])
-# Load data
-precip_df = pd.read_csv('./cleaningOutput/gpcp_precip_cleaned.csv')
-mh_df     = pd.read_csv('./cleaningOutput/combined_mental_health_data.csv')
-decoder   = pd.read_csv('./cleaningOutput/state_codes.csv')
-chlor_data = pd.read_csv('./choropleth_files/cleaningOutput/combined_mental_health_data_state_year_aggregated.csv')
+# Views that can show any BRFSS health metric instead of MENTHLTH
+metric_charts = ["Choropleth - Mental Health", "Choropleth - Date Range", "Choropleth - Correlation",
+                 "Choropleth - Precipitation Sensitivity", "Heatmap - Lagged Correlation",
+                 "Heatmap - All States by Month", "Monthly Precipitation", "Precipitation Anomaly vs. Mental Health"]
+metric = 'MENTHLTH'
+
+# Data layer. Every dataset the app reads and everything derived from it (frames, cubes, the scatter
+# visualizer, cached figures) lives in one snapshot. A background watcher polls the cleaned files'
+# mtimes; when one changes it rebuilds only what depends on that file and swaps a new snapshot in.
+def read_csv(name):
+    return lambda data, catalog: pd.read_csv(catalog['datasets'][name]['path'])
+
+def build_cube(data, catalog):
+    # the cube written by `python -m analysis_files.cube` when it was built from exactly these CSVs
+    # (it records their content hashes), otherwise built here
+    if is_current(catalog, 'monthly_cube'):
+        return load_cube(catalog['datasets']['monthly_cube']['path'])
+    return build_monthly_cube(data['precip_df'], data['mh_df'], data['decoder'])
+
+def build_anomaly_cube(data, catalog):
+    # standardized anomalies precomputed by Precipitation/precip_anomaly.py, on the monthly cube's axes
+    cube = data['cube']
+    anomaly_df = pd.read_csv(catalog['datasets']['precip_anomaly']['path'])
+    return {'states': cube['states'], 'months': cube['months'], 'mh_mean': cube['mh_mean'],
+            'metrics': cube['metrics'], 'metric_mean': cube['metric_mean'],
+            'std_anomaly': state_month_grid(anomaly_df, 'std_anomaly', cube['states'], cube['months'])}
+
+def build_yearly(data, catalog):
+    # state x year tables for the precipitation and combined maps; mental health is the cube's
+    # respondent-pooled MENTHLTH means, like every metric on the mental health map
+    cube = data['cube']
+    means, years = data['annual_means']
+    menthlth = means['metric_mean'][:, :, list(cube['metrics']).index('MENTHLTH')]
+    mental = pd.DataFrame({'State': np.repeat(cube['states'], len(years)), 'Year': np.tile(years, len(cube['states'])),
+                           'MenHealth_MeanValue': menthlth.ravel()})
+    return yearly_tables(data['precip_df'], mental)
+
+def build_county_precip(data, catalog):
+    # written by `python Precipitation/netcdf_engine.py Precipitation/weather_variables_county.json`;
+    # None until it has been built (the catalog leaves out files that don't exist)
+    if 'county_weather' not in catalog['datasets']:
+        return None
+    county_df = pd.read_csv(catalog['datasets']['county_weather']['path'], parse_dates=['time'], dtype={'county': str})
+    return county_df[county_df['variable'] == 'precip']
+
+def build_county_geojson(data, catalog):
+    # simplified outlines from `python -m geometry_files.geometry counties`, built here from the
+    # shapefile if only that is there (the new file is then picked up like any other refresh)
+    if 'county_outlines' not in catalog['datasets'] and not os.path.exists(county_shapefile):
+        return None
+    if not os.path.exists(county_geojson):
+        build_geojson('counties')
+    with open(county_geojson) as f:
+        return json.load(f)
+
+# (name, inputs, build) in dependency order; inputs are catalog datasets or earlier names
+data_builders = [
+    ('precip_df', ['precipitation'], read_csv('precipitation')),
+    ('mh_df', ['mental_health'], read_csv('mental_health')),
+    ('decoder', ['state_codes'], read_csv('state_codes')),
+    ('cube', ['monthly_cube', 'precip_df', 'mh_df', 'decoder'], build_cube),
+    ('prefix', ['cube'], lambda data, catalog: prefix_sums(data['cube'])),
+    ('anomaly_cube', ['precip_anomaly', 'cube'], build_anomaly_cube),
+    # (S, Y) precipitation and (S, Y, M) metric means, sliced per year / metric by the views
+    ('annual_means', ['cube'], lambda data, catalog: annual_means(data['cube'])),
+    ('yearly', ['precip_df', 'cube', 'annual_means'], build_yearly),
+    # calendar-year, quarter, season and water-year means per state (Precipitation/precip_aggregate.py)
+    ('precip_periods', ['precip_df'], lambda data, catalog: aggregate_all(data['precip_df'])),
+    ('county_precip', ['county_weather'], build_county_precip),
+    ('county_geojson', ['county_outlines'], build_county_geojson),
+    ('adjacency', ['cube'], lambda data, catalog: build_adjacency(data['cube']['states'])),
+    # the visualizer converts its frames' dates in place, so it gets its own copies
+    ('scatter', ['precip_df', 'mh_df', 'decoder'],
+     lambda data, catalog: ScatterplotVisualizer(data['precip_df'].copy(), data['mh_df'].sort_values(by='IMONTH'),
+                                                 data['decoder'], title='Monthly Precip vs. Poor Mental Heath Days',
+                                                 cmap='Cividis')),
+]
+
+@st.cache_resource
+def data_watcher():
+    # one watcher per server; the first session waits for the initial build, later refreshes happen in the background
+    return DataWatcher(data_builders, interval=5.0).start()
+
+# This run's snapshot. Everything below reads this one object, so a refresh that lands
+# mid-run is only seen on the next rerun and a page never mixes old and new data.
+snapshot = data_watcher().snapshot
+data = snapshot.data
+
+# Dataset catalog of this snapshot: years, months, states and ranges written by the pipelines
+dims = snapshot.catalog['datasets']
+# years with all twelve months of both precipitation and mental health data
+complete_years = sorted(set(dims['precipitation']['complete_years']) & set(dims['mental_health']['complete_years']))
+
+precip_df = data['precip_df']
+mh_df     = data['mh_df']
+decoder   = data['decoder']
+
+def load_monthly_cube():
+    return data['cube']
+
+def load_prefix_cube():
+    return data['prefix']
+
+def load_anomaly_cube():
+    return data['anomaly_cube']
+
+def load_annual_means():
+    return data['annual_means']
+
+def load_adjacency():
+    return data['adjacency']
+
+# Analysis results some views need, computed on first use and kept with the snapshot;
+# a data refresh recomputes the ones already in use before the new snapshot goes live
+def load_correlations(n_resamples=1000, metric='MENTHLTH'):
+    return snapshot.cached(('correlations', n_resamples, metric), ['cube'],
+                           lambda data: correlate_by_state_year(select_metric(data['cube'], metric), n_resamples=n_resamples))
+
+def load_lag_correlations(max_lag=6, deseasonalize=False, metric='MENTHLTH'):
+    return snapshot.cached(('lags', max_lag, deseasonalize, metric), ['cube'],
+                           lambda data: lag_correlations(select_metric(data['cube'], metric), max_lag=max_lag,
+                                                         deseasonalize=deseasonalize))
+
+def load_lisa(variable, year, metric='MENTHLTH'):
+    def build(data):
+        cube = data['cube']
+        means, years = data['annual_means']
+        if variable == 'mh_mean':
+            values = means['metric_mean'][:, list(years).index(year), list(cube['metrics']).index(metric)]
+        else:
+            values = means[variable][:, list(years).index(year)]
+        return morans_i(cube['states'], values, data['adjacency'])
+    return snapshot.cached(('lisa', variable, year, metric), ['cube', 'annual_means', 'adjacency'], build)
+
+def load_scatter_visualizer():
+    return data['scatter']
+
+def load_state_payloads(metric='MENTHLTH'):
+    # every state's monthly scatter for every year, as ready-to-send figure dicts (~2 MB per metric),
+    # so clicking a state on a map is a dictionary lookup
+    def build(data):
+        figures = data['scatter'].figures(colorscale='blues', size_range=(15, 30), metric=metric)
+        return {key: figure_spec(fig) for key, fig in figures.items() if fig is not None}
+    return snapshot.cached(('payloads', metric), ['scatter'], build)
+
+def clicked_state(spec, event):
+    # state abbreviation of the first selected map point, if any
+    for point in event.selection.points:
+        if point.get('location'):
+            return point['location']
+        locations = spec['data'][point['curve_number']].get('locations')
+        if locations is not None:
+            return locations[point['point_index']]
+    return None
+
+@st.fragment
+def linked_choropleth(spec, year):
+    """
+    The choropleth with a linked monthly scatter under it. Clicking a state
+    reruns only this fragment (not the data loading above), and the scatter
+    comes out of the precomputed payloads.
+    """
+    event = st.plotly_chart(SpecFigure(spec), on_select='rerun', selection_mode='points', key=f'map_{chart_type}')
+    state = clicked_state(spec, event)
+    if state is None:
+        st.caption('Click a state to see its monthly precipitation and mental health.')
+        return
+    payloads = load_state_payloads(metric)
+    years = sorted({y for y, s in payloads if s == state})
+    if not years:
+        st.warning(f'No monthly data available for {state}.')
+        return
+    linked_year = st.selectbox(f'{state} year', years, index=years.index(year) if year in years else len(years) - 1)
+    st.plotly_chart(SpecFigure(payloads[(linked_year, state)]), key='linked_scatter')
+
+linked_charts = ["Choropleth - Precipitation", "Choropleth - Precipitation Period", "Choropleth - Mental Health", "Choropleth - Combined",
+                 "Choropleth - Date Range", "Choropleth - Precipitation Anomaly", "Choropleth - Correlation",
+                 "Choropleth - Precipitation Sensitivity"]
+
+season_options = {
+    'All months': tuple(range(1, 13)),
+    'Winters (Dec-Feb)': (12, 1, 2),
+    'Springs (Mar-May)': (3, 4, 5),
+    'Summers (Jun-Aug)': (6, 7, 8),
+    'Falls (Sep-Nov)': (9, 10, 11),
+}
 
 selected_state = ''
 selected_year = ''
+show_lisa = False
+
+if chart_type in metric_charts:
+    # every metric is already in the cube's metric axis, so switching is a slice
+    metric = st.sidebar.selectbox("Health Metric", list(load_monthly_cube()['metrics']),
+                                  format_func=lambda name: metrics[name]['label'])
+metric_label = metrics[metric]['label']
+# PR and the other territories need our own state GeoJSON and lose plotly's AK/HI insets, so they are opt-in;
+# only the maps drawn from the precipitation table have them (the cube-based maps cover the 50 states + DC)
+territory_charts = ["Choropleth - Precipitation", "Choropleth - Precipitation Period"]
+territories = chart_type in territory_charts and st.sidebar.checkbox("Include territories (PR)")
 
 # Plotly visualizations
 if chart_type == "Monthly Precipitation":
 
-    state_options = decoder['Abbreviation'].sort_values().unique()
-    selected_state = st.sidebar.selectbox("Select State", state_options)
+    selected_state = st.sidebar.selectbox("Select State", dims['state_codes']['states'])
+    selected_year = st.sidebar.selectbox("Select Year", dims['mental_health']['years'])
 
-    year_options = mh_df['IYEAR'].sort_values().unique()
-    selected_year = st.sidebar.selectbox("Select Year", year_options)
+    # Instantiate visualizer (once per server; it keeps its arrays and skeletons)
+    viz = load_scatter_visualizer()
 
-    # Instantiate visualizer
-    viz = ScatterplotVisualizer(
-        precip_df, mh_df.sort_values(by='IMONTH'), decoder,
-        title='Monthly Precip vs. Poor Mental Heath Days',
-        cmap='Cividis'
-    )
+    # Level of detail: auto switches to WebGL / binned density for very large selections
+    detail = st.sidebar.radio("Detail", ['auto', 'points', 'density'],
+                              format_func={'auto': 'Auto', 'points': 'All points', 'density': 'Binned density'}.get)
 
     # Create scatter for Washington in 2018
     fig = viz.visualize(
         year=selected_year,
         state=selected_state,
         colorscale='blues',
-        size_range=(15, 30)
+        size_range=(15, 30),
+        lod=detail,
+        metric=metric
     )
 elif chart_type == "Choropleth - Precipitation":
-    year_options = chlor_data['Year'].sort_values().unique()
-    selected_year = st.sidebar.selectbox("Select Year", list(map(int, year_options[:-1])))
-    fig = choropleth_precip(int(selected_year))
+    selected_year = st.sidebar.selectbox("Select Year", complete_years)
+    fig = choropleth_precip(int(selected_year), tables=data['yearly'], territories=territories)
+    show_lisa = st.sidebar.checkbox("Overlay LISA clusters")
+    if show_lisa:
+        moran_global, lisa_df = load_lisa('precip', int(selected_year))
+        fig = add_lisa_overlay(fig, lisa_df)
+
+elif chart_type == "Choropleth - Precipitation Period":
+    precip_periods = data['precip_periods']
+    selected_year = st.sidebar.selectbox("Select Year", list(map(int, np.unique(precip_periods['Year']))))
+    # only the periods with every month in the data (e.g. no water year before the first October)
+    in_year = set(precip_periods.loc[precip_periods['Year'] == selected_year, 'Period'])
+    selected_period = st.sidebar.selectbox("Period", [p for p in period_names if p in in_year], format_func=period_names.get)
+    fig = choropleth_precip_aggregate(precip_periods, selected_year, selected_period, territories=territories)
 
 elif chart_type == "Choropleth - Mental Health":
-    year_options = chlor_data['Year'].sort_values().unique()
-    selected_year = st.sidebar.selectbox("Select Year", list(map(int, year_options[:-1])))
-    fig = choropleth_mental(selected_year)
+    selected_year = st.sidebar.selectbox("Select Year", complete_years)
+    # every metric, MENTHLTH included, from the cube's respondent-pooled annual means
+    means, years = load_annual_means()
+    year_means = means['metric_mean'][:, list(years).index(selected_year), list(load_monthly_cube()['metrics']).index(metric)]
+    fig = choropleth_mental(selected_year, load_monthly_cube()['states'], year_means, metric_label)
+    year_df = pd.DataFrame({'State': load_monthly_cube()['states'], 'Year': selected_year, metric: year_means}).dropna()
+    show_lisa = st.sidebar.checkbox("Overlay LISA clusters")
+    if show_lisa:
+        moran_global, lisa_df = load_lisa('mh_mean', int(selected_year), metric)
+        fig = add_lisa_overlay(fig, lisa_df)
 
 elif chart_type == "Choropleth - Combined":
-    year_options = chlor_data['Year'].sort_values().unique()
-    selected_year = st.sidebar.selectbox("Select Year", list(map(int, year_options[:-1])))
-    fig = choropleth_combined(selected_year)
+    selected_year = st.sidebar.selectbox("Select Year", complete_years)
+    fig = choropleth_combined(selected_year, tables=data['yearly'])
+    year_column = data['yearly']['mental'][selected_year].dropna()
+    year_df = pd.DataFrame({'State': year_column.index, 'Year': selected_year, 'MENTHLTH': year_column.to_numpy()})
+
+elif chart_type == "Choropleth - Date Range":
+    prefix = select_metric(load_prefix_cube(), metric)
+    month_options = [str(m) for m in prefix['months']]
+    start_month, end_month = st.sidebar.select_slider("Select Date Range", month_options,
+                                                      value=(month_options[0], month_options[-1]))
+    season = st.sidebar.selectbox("Months", list(season_options))
+    range_variable = st.sidebar.radio("Variable", ['precip', 'mh_mean'],
+                                      format_func={'precip': 'Precipitation', 'mh_mean': metric_label}.get)
+    # two prefix-sum lookups per contiguous run of selected months
+    ranges = season_ranges(start_month, end_month, season_options[season])
+    range_values = range_means(prefix, ranges) if ranges else {range_variable: np.full(len(prefix['states']), np.nan)}
+    period = f"{start_month} to {end_month}" + ('' if season == 'All months' else f", {season.lower()}")
+    fig = choropleth_date_range(prefix['states'], range_values[range_variable], range_variable, period, metric_label)
+
+elif chart_type == "Choropleth - Precipitation Anomaly":
+    anomaly_cube = load_anomaly_cube()
+    anomaly_months = anomaly_cube['months']
+    selected_year = st.sidebar.selectbox("Select Year", dims['precip_anomaly']['years'])
+    in_year = anomaly_months.astype('datetime64[Y]').astype(int) + 1970 == selected_year
+    # yearly mean of the precomputed monthly anomalies (states without data stay NaN)
+    year_anomaly = pd.DataFrame(anomaly_cube['std_anomaly'][:, in_year]).mean(axis=1).to_numpy()
+    fig = choropleth_anomaly(anomaly_cube['states'], year_anomaly, selected_year)
+
+elif chart_type == "Choropleth - County Precipitation":
+    county_df = data['county_precip']
+    if county_df is not None and data['county_geojson'] is not None:
+        year_options = np.unique(county_df['time'].dt.year)
+        selected_year = st.sidebar.selectbox("Select Year", list(map(int, year_options)))
+        fig = choropleth_county(county_df, data['county_geojson'], selected_year)
+    else:
+        fig = None
+        st.info('County data has not been built yet. Download cb_2018_us_county_20m into Precipitation/ and run '
+                '`python Precipitation/netcdf_engine.py Precipitation/weather_variables_county.json` and '
+                '`python -m geometry_files.geometry counties` from the repo root.')
+
+elif chart_type == "Precipitation Anomaly vs. Mental Health":
+    anomaly_cube = select_metric(load_anomaly_cube(), metric)
+    state_options = ['US'] + dims['monthly_cube']['states']
+    selected_state = st.sidebar.selectbox("Select State", state_options)
+    anomaly_months = anomaly_cube['months']
+    anomaly_years = anomaly_months.astype('datetime64[Y]').astype(int) + 1970
+    year_options = ['All'] + dims['precip_anomaly']['years']
+    selected_year = st.sidebar.selectbox("Select Year", year_options)
+    rows = np.ones(len(anomaly_cube['states']), dtype=bool) if selected_state == 'US' else anomaly_cube['states'] == selected_state
+    cols = np.ones(len(anomaly_months), dtype=bool) if selected_year == 'All' else anomaly_years == selected_year
+    grid_states, grid_months = np.meshgrid(anomaly_cube['states'][rows], anomaly_months[cols], indexing='ij')
+    fig = anomaly_scatter(grid_states.ravel(), grid_months.ravel(),
+                          anomaly_cube['std_anomaly'][np.ix_(rows, cols)].ravel(),
+                          anomaly_cube['mh_mean'][np.ix_(rows, cols)].ravel(),
+                          title=f"Precipitation Anomaly vs. {metric_label} — {selected_state} {selected_year}",
+                          metric=metric)
+
+elif chart_type == "Choropleth - Correlation":
+    corr_df = load_correlations(metric=metric)
+    year_options = corr_df.dropna(subset=['r'])['Year'].unique()
+    selected_year = st.sidebar.selectbox("Select Year", list(map(int, year_options)))
+    selected_method = st.sidebar.radio("Correlation", ['pearson', 'spearman'], format_func=str.title)
+    fig = choropleth_correlation(corr_df, selected_year, selected_method)
+
+elif chart_type == "Choropleth - Precipitation Sensitivity":
+    cube = select_metric(load_monthly_cube(), metric)
+    month_options = [str(m) for m in cube['months'][~np.isnan(cube['precip']).all(axis=0)]]
+    start_month, end_month = st.sidebar.select_slider("Select Date Range", month_options,
+                                                      value=(month_options[0], month_options[-1]))
+    # refit on every change; one batched solve for all states
+    sens_df = fit_sensitivity(cube, start_month, end_month)
+    fig = choropleth_sensitivity(sens_df, f"({start_month} to {end_month})")
+
+elif chart_type == "Heatmap - Lagged Correlation":
+    deseasonalize = st.sidebar.checkbox("Remove seasonal cycle", value=True)
+    lag_df = load_lag_correlations(max_lag=6, deseasonalize=deseasonalize, metric=metric)
+    fig = lag_heatmap(lag_df)
+
+elif chart_type == "Heatmap - All States by Month":
+    overview_options = {'Both': ('mh_mean', 'precip'), 'Mental Health': ('mh_mean',), 'Precipitation': ('precip',)}
+    overview_choice = st.sidebar.radio("Show", list(overview_options))
+    standardize = st.sidebar.checkbox("Standardize each state", value=False)
+    cube = select_metric(load_monthly_cube(), metric)
+    # the cube is already a dense state x month array, so this is a straight redraw
+    fig = state_month_heatmap(cube, overview_options[overview_choice], standardize, metric=metric)
 
 # Display Plotly figure
-if fig:
-    st.plotly_chart(fig)
+if fig and chart_type in linked_charts:
+    with st.spinner('Preparing state drill-downs...'):
+        load_state_payloads(metric)   # once per server and metric, so the first click is as fast as the rest
+    # maps covering a date range link to the scatter of their last year
+    linked_choropleth(figure_spec(fig), int(selected_year) if selected_year else int(end_month[:4]))
+elif fig:
+    # float32 typed arrays instead of plotly's float64 ones, sent without validating the figure again
+    st.plotly_chart(SpecFigure(figure_spec(fig)))
 else:
     if chart_type == "Monthly Precipitation":
         st.warning(f'No data available for this {selected_state} in year {selected_year}. Please select a different option.')
+    elif chart_type == "Precipitation Anomaly vs. Mental Health":
+        st.warning(f'No data available for {selected_state} in {selected_year}. Please select a different option.')
 
 
 # Visualization Captions
@@ -75,9 +397,17 @@ if fig:
     if chart_type == "Monthly Precipitation":
         st.write(f'''Monthly precipitation (mm/day) vs. average days of poor mental health in {selected_state}, {selected_year}. 
                 Each circle’s size and color intensity encode the mean number of self-reported poor mental-health days.''')
+        if 'binned' in fig.layout.title.text:
+            st.write('''Binned view: each circle is one month × precipitation bin; its size is the number of respondents 
+                     and its color their average number of poor mental-health days.''')
     elif chart_type == "Choropleth - Precipitation":
         st.write(f'Average monthly precipitation in mm year {selected_year}')
 
+    elif chart_type == "Choropleth - Precipitation Period":
+        st.write(f'''Average precipitation (mm/day) by state over the {period_names[selected_period]} of {selected_year}. 
+                 Seasons are meteorological (winter is December to February, counted in the year of its February) 
+                 and the water year runs from October of the previous year to September.''')
+
     elif chart_type == "Choropleth - Mental Health":
         st.write(f'Average number of days individuals feel depressed or down per month by state in year {selected_year} ')
 
@@ -86,6 +416,53 @@ if fig:
                  Precipitation is shown by the color of the state and the number of days down/depressed are shown by 
                  the size of the overlayed dot.''')
 
+    elif chart_type == "Choropleth - Date Range":
+        st.write(f'''{'Average monthly precipitation (mm/day)' if range_variable == 'precip' else 'Average number of days individuals feel depressed or down per month'} 
+                 by state over {period}.''')
+
+    elif chart_type == "Choropleth - Precipitation Anomaly":
+        st.write(f'''Average standardized precipitation anomaly by state in {selected_year}: how many standard deviations 
+                 wetter (green) or drier (brown) each month was than that state's normal for the same calendar month, 
+                 averaged over the year.''')
+
+    elif chart_type == "Choropleth - County Precipitation":
+        st.write(f'''Average monthly precipitation (mm/day) by county in {selected_year}. Each county is the area-weighted 
+                 mean of the GPCP grid cells overlapping it, drawn from simplified county outlines.''')
+
+    elif chart_type == "Precipitation Anomaly vs. Mental Health":
+        st.write(f'''Each point is one state-month ({selected_state}, {selected_year}). The x-axis is how unusually wet or dry 
+                 the month was for that state and time of year; the y-axis is the average number of poor mental-health days.''')
+
+    elif chart_type == "Choropleth - Correlation":
+        st.write(f'''{selected_method.title()} correlation between monthly precipitation and the average number of poor 
+                 mental-health days for each state in {selected_year}. Hover a state for its 95% bootstrap confidence 
+                 interval (1,000 resamples) and the number of months used.''')
+
+    elif chart_type == "Choropleth - Precipitation Sensitivity":
+        st.write(f'''Change in the average number of poor mental-health days per additional mm/day of monthly 
+                 precipitation, {start_month} to {end_month}. Each state is a separate regression with month-of-year 
+                 fixed effects, so seasonal swings in both variables do not drive the slope. Hover a state for its 
+                 standard error, t statistic and number of months.''')
+
+    elif chart_type == "Heatmap - Lagged Correlation":
+        st.write(f'''Correlation between precipitation in one month and the average number of poor mental-health days 
+                 0–6 months later, for every state over 2018–2023. Positive values mean wetter months are followed by 
+                 more poor mental-health days.''' + (' The average seasonal cycle of both series is removed first.' if deseasonalize else ''))
+
+    elif chart_type == "Heatmap - All States by Month":
+        st.write('''Monthly average number of poor mental-health days and average precipitation (mm/day) for every state. 
+                 Blank cells are months with no survey responses or no precipitation data.''' + 
+                 (' Each state is standardized over its own months, so colors show unusually high (red) or low (blue) months for that state.' if standardize else ''))
+
+    if show_lisa:
+        st.write(f'''Global Moran's I = {moran_global['I']:.2f} (expected {moran_global['Expected_I']:.2f} with no 
+                 spatial pattern, permutation p = {moran_global['P']:.3f}). Diamonds mark states in significant local 
+                 clusters: High-High / Low-Low states resemble their neighbours, High-Low / Low-High are outliers.''')
+
+    if chart_type in metric_charts and metric != 'MENTHLTH':
+        st.write(f'''Mental health values in this view are the average {metric_label.lower()} reported by 
+                 respondents ({metric}) rather than poor mental-health days.''')
+
 if fig:
     # Optionally show the dataframe
     # Visualization Captions
@@ -98,6 +475,24 @@ if fig:
 
     elif chart_type == "Choropleth - Mental Health" or chart_type == "Choropleth - Combined":
         if st.checkbox("Show DataFrame Head"):
-            st.write(chlor_data[chlor_data['Year'] == selected_year].reset_index(drop=True).head())
+            st.write(year_df.reset_index(drop=True).head())
+
+    elif chart_type == "Choropleth - Correlation":
+        if st.checkbox("Show DataFrame Head"):
+            st.write(corr_df[(corr_df['Year'] == selected_year) & (corr_df['Method'] == selected_method)].reset_index(drop=True).head())
+
+    elif chart_type == "Choropleth - Precipitation Sensitivity":
+        if st.checkbox("Show DataFrame Head"):
+            st.write(sens_df.dropna(subset=['Slope']).reset_index(drop=True).head())
+
+    elif chart_type == "Heatmap - Lagged Correlation":
+        if st.checkbox("Show DataFrame Head"):
+            st.write(lag_df.dropna(subset=['r']).reset_index(drop=True).head())
+
+    elif chart_type == "Heatmap - All States by Month":
+        if st.checkbox("Show DataFrame Head"):
+            for variable in overview_options[overview_choice]:
+                st.write(pd.DataFrame(cube[variable], index=cube['states'],
+                                      columns=np.datetime_as_string(cube['months'], unit='M')).head())
 
 
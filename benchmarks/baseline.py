@@ -0,0 +1,20 @@
+import subprocess
+import types
+
+# The app's modules as they were in the repo's first commit, so the benchmarks can time the
+# original code ("before") on the same CSVs as the current builders ("after").
+# Run from the repo root; the baseline modules read their CSVs at import like they used to.
+
+
+def baseline_commit():
+    return subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], capture_output=True, text=True,
+                          check=True).stdout.split()[0]
+
+
+def baseline_module(path, name):
+    # exec the file's source at the first commit into a fresh module (not registered in sys.modules)
+    commit = baseline_commit()
+    source = subprocess.run(['git', 'show', f'{commit}:{path}'], capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType(name)
+    exec(compile(source, f'{commit[:7]}:{path}', 'exec'), module.__dict__)
+    return module
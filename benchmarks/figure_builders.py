@@ -0,0 +1,55 @@
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, '.')
+from benchmarks.baseline import baseline_module
+from choropleth_files.choropleth import (choropleth_precip, choropleth_mental, choropleth_combined, yearly_tables,
+                                          precip_path, mental_path)
+from scatterplot_files.scatterplot import ScatterplotVisualizer
+from analysis_files.cube import load_cube
+from heatmap_files.heatmap import state_month_heatmap
+
+# Run from the repo root: python benchmarks/figure_builders.py
+# Per-call time of the skeleton-based figure builders ("after") vs the original plotly.express /
+# pandas code from the repo's first commit ("before", see baseline.py), on the same CSVs.
+# Import-time work (reading the CSVs, the baseline module's own figure build) is not timed.
+
+
+def timed(fn, repeat=30):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def scatter_inputs():
+    return (pd.read_csv('./cleaningOutput/gpcp_precip_cleaned.csv'),
+            pd.read_csv('./cleaningOutput/combined_mental_health_data.csv').sort_values(by='IMONTH'),
+            pd.read_csv('./cleaningOutput/state_codes.csv'))
+
+
+if __name__ == '__main__':
+    old_choropleth = baseline_module('choropleth_files/choropleth.py', 'baseline_choropleth')
+    old_scatter = baseline_module('scatterplot_files/scatterplot.py', 'baseline_scatterplot')
+    # the tables the app keeps in its data snapshot
+    tables = yearly_tables(pd.read_csv(precip_path), pd.read_csv(mental_path))
+    viz = ScatterplotVisualizer(*scatter_inputs())
+    old_viz = old_scatter.ScatterplotVisualizer(*scatter_inputs())
+    cube = load_cube('./cleaningOutput/monthly_cube.npz')
+    cases = {
+        'choropleth_precip': (lambda: old_choropleth.choropleth_precip(2019), lambda: choropleth_precip(2019, tables=tables)),
+        'choropleth_mental': (lambda: old_choropleth.choropleth_mental(2019), lambda: choropleth_mental(2019, tables=tables)),
+        'choropleth_combined': (lambda: old_choropleth.choropleth_combined(2019),
+                                lambda: choropleth_combined(2019, tables=tables)),
+        'scatter WA': (lambda: old_viz.visualize(year=2019, state='WA'), lambda: viz.visualize(year=2019, state='WA')),
+        'scatter US': (lambda: old_viz.visualize(year=2019, state='US'), lambda: viz.visualize(year=2019, state='US')),
+        'all states x months': (None, lambda: state_month_heatmap(cube)),
+        'all states, z-scored': (None, lambda: state_month_heatmap(cube, standardize=True)),
+    }
+    print(f"{'figure':<22}{'before ms':>12}{'after ms':>12}")
+    for name, (reference, builder) in cases.items():
+        before = f"{timed(reference):.2f}" if reference else '-'
+        print(f"{name:<22}{before:>12}{timed(builder):>12.2f}")
@@ -0,0 +1,67 @@
+import sys
+import time
+
+import pandas as pd
+import plotly.io as pio
+import plotly.tools
+
+sys.path.insert(0, '.')
+from benchmarks.baseline import baseline_module
+from choropleth_files.choropleth import choropleth_precip, choropleth_mental, choropleth_combined
+from scatterplot_files.scatterplot import ScatterplotVisualizer
+from figure_files.payload import figure_json, figure_spec, SpecFigure
+
+# Run from the repo root: python benchmarks/figure_payload.py
+# Payload bytes and time per figure type for what st.plotly_chart does with its argument
+# (plotly.tools.return_figure_from_figure_or_data(..., validate_figure=True), then
+# pio.to_json(..., validate=False)): the plotly figure itself, the plain figure_spec dict,
+# and SpecFigure(figure_spec(...)) which app.py sends. figure_json is the standalone encoder.
+# "before" is the same chart_json work on the figure the repo's first commit built for the same
+# year and state (see baseline.py). Building the figures is not timed.
+
+
+def chart_json(figure_or_data):
+    # the two calls st.plotly_chart makes to turn its argument into the JSON it sends
+    figure = plotly.tools.return_figure_from_figure_or_data(figure_or_data, validate_figure=True)
+    return pio.to_json(figure, validate=False)
+
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+if __name__ == '__main__':
+    precip_df = pd.read_csv('./cleaningOutput/gpcp_precip_cleaned.csv')
+    mh_df = pd.read_csv('./cleaningOutput/combined_mental_health_data.csv')
+    decoder = pd.read_csv('./cleaningOutput/state_codes.csv')
+    viz = ScatterplotVisualizer(precip_df, mh_df.sort_values(by='IMONTH'), decoder)
+    old_choropleth = baseline_module('choropleth_files/choropleth.py', 'baseline_choropleth')
+    old_viz = baseline_module('scatterplot_files/scatterplot.py', 'baseline_scatterplot').ScatterplotVisualizer(
+        precip_df, mh_df.sort_values(by='IMONTH'), decoder)
+
+    # (first-commit figure, current figure)
+    figures = {
+        'choropleth_precip': (old_choropleth.choropleth_precip(2019), choropleth_precip(2019)),
+        'choropleth_mental': (old_choropleth.choropleth_mental(2019), choropleth_mental(2019)),
+        'choropleth_combined': (old_choropleth.choropleth_combined(2019), choropleth_combined(2019)),
+        'scatter WA': (old_viz.visualize(year=2019, state='WA'), viz.visualize(year=2019, state='WA')),
+        'scatter US': (old_viz.visualize(year=2019, state='US'), viz.visualize(year=2019, state='US')),
+    }
+
+    paths = {
+        'before': None,
+        'figure': lambda fig: chart_json(fig),
+        'spec dict': lambda fig: chart_json(figure_spec(fig)),
+        'SpecFigure': lambda fig: chart_json(SpecFigure(figure_spec(fig))),
+        'figure_json': lambda fig: figure_json(fig),
+    }
+    print(f"{'figure':<22}" + ''.join(f"{path + ' B':>16}{'ms':>7}" for path in paths))
+    for name, (old_fig, fig) in figures.items():
+        row = f"{name:<22}"
+        for path in paths.values():
+            payload, ms = timed(lambda: chart_json(old_fig)) if path is None else timed(lambda: path(fig))
+            row += f"{len(payload):>16}{ms:>7.2f}"
+        print(row)
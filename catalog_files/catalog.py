@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Paths relative to the repo root. The catalog only holds content (hashes, dimensions) and is
+# committed; the mtime / size stamps used to skip hashing are machine-local and kept next to it, untracked
+catalog_path = './cleaningOutput/catalog.json'
+
+# Datasets described in the catalog and how to read their dimensions:
+# time (a date column) or year / month columns, a state column, and the value columns to summarize
+datasets = {
+    'precipitation': {'path': './cleaningOutput/gpcp_precip_cleaned.csv',
+                      'time': 'time', 'state': 'state_abbr', 'values': ['precip']},
+    'mental_health': {'path': './cleaningOutput/combined_mental_health_data.csv',
+                      'year': 'IYEAR', 'month': 'IMONTH', 'state': '_STATE',
+                      'values': ['GENHLTH', 'PHYSHLTH', 'MENTHLTH', 'POORHLTH']},
+    'mental_state_year': {'path': './cleaningOutput/combined_mental_health_data_state_year_aggregated.csv',
+                          'year': 'Year', 'state': 'State', 'values': ['MenHealth_MeanValue']},
+    'state_codes': {'path': './cleaningOutput/state_codes.csv', 'state': 'Abbreviation'},
+    'precip_anomaly': {'path': './cleaningOutput/gpcp_precip_anomaly.csv',
+                       'time': 'time', 'state': 'state_abbr', 'values': ['std_anomaly']},
+    # county data, not in the repo until built (see geometry_files/README.md); absent files are left out
+    'county_weather': {'path': './cleaningOutput/weather_county_month.csv',
+                       'time': 'time', 'values': ['value']},
+    'county_outlines': {'path': './cleaningOutput/geojson/counties.geojson'},
+    # built from these datasets; the npz records their content hashes (see is_current)
+    'monthly_cube': {'path': './cleaningOutput/monthly_cube.npz',
+                     'sources': ['precipitation', 'mental_health', 'state_codes']},
+}
+
+
+def file_hash(path):
+    # sha1 of the file's bytes, read in 1 MB chunks
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    # (mtime, size): cheap check for whether a file changed on this machine since it was hashed
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def stamps_path(path=catalog_path):
+    return os.path.splitext(path)[0] + '_stamps.json'
+
+
+def source_hashes(name):
+    # current content hashes of the datasets a derived file is built from
+    return {source: file_hash(datasets[source]['path']) for source in datasets[name].get('sources', [])}
+
+
+def describe(name, spec=None):
+    """
+    Catalog entry for one dataset: content hash, row count and columns, the
+    sorted years / months / states it covers, the years with all 12 months
+    ('complete_years') and the [min, max] of each value column. Years,
+    months and states only count rows with at least one value.
+    """
+    spec = spec or datasets[name]
+    path = spec['path']
+    entry = {'path': path, 'hash': file_hash(path)}
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            entry['arrays'] = {key: list(data[key].shape) for key in data.files if key != 'sources'}
+            if 'sources' in data.files:
+                entry['sources'] = json.loads(str(data['sources']))
+            if 'states' in data.files:
+                entry['states'] = sorted(data['states'].astype(str).tolist())
+            if 'months' in data.files:
+                entry['months'] = data['months'].astype(str).tolist()
+        return entry
+
+    if path.endswith('.geojson'):
+        with open(path) as f:
+            entry['regions'] = len(json.load(f)['features'])
+        return entry
+
+    table = pd.read_csv(path)
+    entry['rows'] = len(table)
+    entry['columns'] = list(table.columns)
+    values = spec.get('values', [])
+    if values:
+        table = table[table[values].notna().any(axis=1)]
+        entry['ranges'] = {column: [float(table[column].min()), float(table[column].max())] for column in values}
+
+    if 'time' in spec:
+        months = pd.to_datetime(table[spec['time']]).to_numpy().astype('datetime64[M]')
+    elif 'month' in spec:
+        months = ((table[spec['year']].astype(int) - 1970) * 12 + table[spec['month']].astype(int) - 1).to_numpy()
+        months = months.astype('datetime64[M]')
+    else:
+        months = None
+    if months is not None:
+        months = np.unique(months)
+        years = months.astype('datetime64[Y]').astype(int) + 1970
+        entry['months'] = months.astype(str).tolist()
+        entry['years'] = np.unique(years).tolist()
+        entry['complete_years'] = [int(year) for year, n in zip(*np.unique(years, return_counts=True)) if n == 12]
+    elif 'year' in spec:
+        entry['years'] = sorted(int(year) for year in table[spec['year']].dropna().unique())
+
+    if 'state' in spec:
+        states = table[spec['state']].dropna().unique()
+        entry['states'] = sorted(int(s) if isinstance(s, (float, np.floating)) else s for s in states)
+    return entry
+
+
+def read_json(path, empty):
+    if not os.path.exists(path):
+        return empty
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(data, path):
+    # write to a temporary file and rename, so readers never see half a file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def read_catalog(path=catalog_path):
+    return read_json(path, {'datasets': {}})
+
+
+def is_current(catalog, name):
+    # a derived file is current when the source hashes it recorded are the catalog's hashes of those sources
+    entry = catalog['datasets'].get(name)
+    if not entry or 'sources' not in entry:
+        return False
+    known = catalog['datasets']
+    return all(source in known and entry['sources'].get(source) == known[source]['hash']
+               for source in datasets[name].get('sources', []))
+
+
+def update_catalog(path=catalog_path, names=None):
+    """
+    Re-describe the datasets whose bytes changed since the catalog was
+    written (or that are new) and write the catalog. Files whose mtime and
+    size match this machine's stamps are not even hashed; a touched file
+    with the same bytes (e.g. after a fresh clone) only gets a new stamp, and
+    the catalog file is left alone. Returns (catalog, names of entries that
+    changed).
+    """
+    catalog = read_catalog(path)
+    stamps = read_json(stamps_path(path), {})
+    changed, stamps_dirty = [], False
+    for name in names or datasets:
+        spec = datasets[name]
+        known = catalog['datasets'].get(name)
+        if not os.path.exists(spec['path']):
+            if known:
+                del catalog['datasets'][name]
+                changed.append(name)
+            stamps_dirty |= stamps.pop(name, None) is not None
+            continue
+        stamp = file_stamp(spec['path'])
+        if known and stamps.get(name) == stamp:
+            continue
+        if not known or known['hash'] != file_hash(spec['path']):
+            catalog['datasets'][name] = describe(name, spec)
+            changed.append(name)
+        stamps[name] = stamp
+        stamps_dirty = True
+    if changed or not os.path.exists(path):
+        write_json(catalog, path)
+    if stamps_dirty:
+        write_json(stamps, stamps_path(path))
+    return catalog, changed
+
+
+if __name__ == '__main__':
+    # python -m catalog_files.catalog  (run from the repo root after refreshing any dataset)
+    catalog, changed = update_catalog()
+    print(f"Catalog: {len(catalog['datasets'])} datasets, updated {', '.join(changed) or 'none'}")
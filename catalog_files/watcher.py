@@ -0,0 +1,140 @@
+import itertools
+import os
+import threading
+import traceback
+
+from catalog_files.catalog import catalog_path, datasets, file_stamp, update_catalog
+
+
+class Snapshot:
+    """
+    One consistent version of the app's data: the catalog it was built from
+    and every derived structure by name (snapshot['cube']). A snapshot is
+    never changed once published, only its lazy entries are filled in, so a
+    reader that holds one keeps seeing the same version of everything.
+    """
+
+    def __init__(self, version, catalog, data, derived=None):
+        self.version = version
+        self.catalog = catalog
+        self.data = data
+        # key -> (inputs, build, value) for entries computed on first use
+        self.derived = derived or {}
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def cached(self, key, inputs, build):
+        """
+        Entry built on first use from this snapshot's data, e.g. one metric's
+        figures or a bootstrap that only some views need.
+        • key    : hashable name of the entry, including its parameters
+        • inputs : names of the data entries it is built from
+        • build  : function(data) -> value
+        A refresh rebuilds the cached entries whose inputs changed before it
+        swaps the new snapshot in, so they stay warm across data updates.
+        """
+        entry = self.derived.get(key)
+        if entry is None:
+            # two sessions asking at once may both build it; either result is the same
+            entry = (tuple(inputs), build, build(self.data))
+            self.derived[key] = entry
+        return entry[2]
+
+
+class DataWatcher:
+    """
+    Keeps `snapshot` in step with the catalog's files.
+    • builders : list of (name, inputs, build) in dependency order; `inputs`
+                 are catalog dataset names or earlier builders' names and
+                 build(data, catalog) returns the structure from the entries
+                 already in `data`
+    • interval : seconds between polls of the files' mtimes
+    A background thread polls the files; when a dataset changed it rebuilds
+    only the builders (and cached entries) downstream of it, reuses the rest
+    from the current snapshot, and publishes the new snapshot with a single
+    assignment. Readers take `watcher.snapshot` once and use only that object,
+    so they never wait for a rebuild or see two versions mixed.
+    """
+
+    def __init__(self, builders, interval=5.0, path=catalog_path):
+        self.builders = builders
+        self.interval = interval
+        self.path = path
+        self.versions = itertools.count(1)
+        self.pending = set()
+        self.lock = threading.Lock()   # one rebuild at a time
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stamps = self.file_stamps()
+        catalog, _ = update_catalog(path)
+        self.snapshot = self.build(catalog)
+
+    def file_stamps(self):
+        return {name: file_stamp(spec['path']) for name, spec in datasets.items() if os.path.exists(spec['path'])}
+
+    def downstream(self, changed):
+        # builders that read a changed dataset, directly or through another builder, in build order
+        dirty = set(changed)
+        names = []
+        for name, inputs, _ in self.builders:
+            if dirty.intersection(inputs):
+                dirty.add(name)
+                names.append(name)
+        return names
+
+    def build(self, catalog, previous=None, changed=()):
+        """
+        New snapshot from `catalog`. With a `previous` snapshot only the
+        entries downstream of the `changed` datasets are rebuilt (plus the
+        cached entries built from them); the others are shared.
+        """
+        data = dict(previous.data) if previous else {}
+        rebuild = self.downstream(changed) if previous else [name for name, _, _ in self.builders]
+        for name, inputs, build in self.builders:
+            if name in rebuild:
+                data[name] = build(data, catalog)
+        derived = {}
+        if previous:
+            for key, (inputs, build, value) in list(previous.derived.items()):
+                derived[key] = (inputs, build, build(data) if set(rebuild).intersection(inputs) else value)
+        return Snapshot(next(self.versions), catalog, data, derived)
+
+    def poll(self):
+        """
+        Check the files once and swap in a rebuilt snapshot if any dataset
+        changed. A file is only picked up once its mtime and size are the
+        same on two polls in a row, so one that is still being written is
+        left for the next poll. Returns the names of the datasets rebuilt.
+        """
+        with self.lock:
+            stamps = self.file_stamps()
+            settled, self.stamps = stamps == self.stamps, stamps
+            if not settled:
+                return []
+            changed = set(self.pending)
+            try:
+                catalog, updated = update_catalog(self.path)
+                changed.update(updated)
+                if changed:
+                    self.snapshot = self.build(catalog, self.snapshot, changed)
+                self.pending = set()
+            except Exception:
+                # a broken or half-copied file: keep serving the current snapshot and try again next poll
+                self.pending = changed
+                traceback.print_exc()
+                return []
+            return sorted(changed)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='data-watcher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
@@ -1,49 +1,111 @@
+import functools
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from geometry_files.geometry import load_geojson
 
 
-precip = pd.read_csv('./cleaningOutput/gpcp_precip_cleaned.csv')
-mental = pd.read_csv('./cleaningOutput/combined_mental_health_data_state_year_aggregated.csv')
+precip_path = './cleaningOutput/gpcp_precip_cleaned.csv'
+mental_path = './cleaningOutput/combined_mental_health_data_state_year_aggregated.csv'
 
-def choropleth_precip(year): 
-    precip['time'] = pd.to_datetime(precip['time'], format='%Y-%m-%d')
-     # Filter data for the specified year
-    data_year = precip[precip['time'].dt.year == year].copy()
-    
+def yearly_tables(precip, mental):
+    # Yearly means per state, pivoted once (rows = states, columns = years); each figure
+    # only picks a column instead of filtering and grouping the long tables again
+    return {'precip': (precip.assign(Year=pd.to_datetime(precip['time']).dt.year)
+                       .pivot_table(index='state_abbr', columns='Year', values='precip', aggfunc='mean')),
+            'mental': mental.pivot_table(index='State', columns='Year', values='MenHealth_MeanValue', aggfunc='mean')}
 
-    fig = px.choropleth(data_year,
-                        locations='state_abbr',
+@functools.lru_cache(maxsize=None)
+def default_tables():
+    # tables of the CSVs on disk, read on the first call that doesn't pass its own; the app always
+    # passes the tables of its data snapshot (tables=), so importing this module reads nothing
+    return yearly_tables(pd.read_csv(precip_path), pd.read_csv(mental_path))
+
+# Codes plotly can draw with locationmode='USA-states' (50 states + DC)
+builtin_states = {
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS',
+    'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC',
+    'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+}
+
+def fit_geometry(fig, territories=False):
+    # Plotly's built-in outlines are the lightest option (nothing extra is sent to the browser)
+    # and keep the albers usa AK/HI insets, so by default codes they can't draw (PR and other
+    # territories in the BRFSS data) are dropped from the choropleth traces. With territories=True
+    # those traces instead switch to our simplified state GeoJSON (geometry_files/geometry.py).
+    traces = [trace for trace in fig.data if trace.type == 'choropleth' and trace.locationmode == 'USA-states']
+    codes = {code for trace in traces for code in trace.locations}
+    if codes <= builtin_states:
+        return fig
+    if not territories:
+        for trace in traces:
+            keep = np.isin(np.asarray(trace.locations, dtype=object).astype(str), list(builtin_states))
+            # every per-location array px may have filled (values, hover text, hover_data)
+            trace.update({name: np.asarray(trace[name])[keep] for name in ('locations', 'z', 'hovertext', 'customdata', 'text')
+                          if trace[name] is not None and np.ndim(trace[name]) > 0 and len(trace[name]) == len(keep)})
+        return fig
+    geojson = load_geojson('states')
+    for trace in traces:
+        trace.update(geojson=geojson, locationmode='geojson-id')
+    # albers usa has no room for the territories, so use a plain conic projection fitted to the data
+    fig.update_geos(scope='world', projection_type='albers', projection_rotation_lon=-96,
+                    projection_parallels=[29.5, 45.5], fitbounds='locations', visible=False)
+    return fig
+
+@functools.lru_cache(maxsize=None)
+def choropleth_skeleton(location_column, value_column, colorbar_title, hover_name=True):
+    # px builds the look once per map type (template, geo scope, colour scale, colorbar, hover
+    # text); later figures copy this plain dict and only swap in their locations and values
+    sample = pd.DataFrame({location_column: ['AL'], value_column: [0.0]})
+    fig = px.choropleth(sample,
+                        locations=location_column,
                         locationmode='USA-states',
-                        color='precip',
-                        hover_name='state_abbr',
+                        color=value_column,
+                        hover_name=location_column if hover_name else None,
                         color_continuous_scale=px.colors.sequential.Plasma,
-                        title=f"Average GPCP Precipitation (mm/day) in {year}",
+                        title=' ',
                         scope='usa'
                     )
-    fig.update_layout(coloraxis_colorbar=dict(title="Precipitation (mm/day)"))
+    fig.update_layout(coloraxis_colorbar=dict(title=colorbar_title))
+    return fig.to_plotly_json()
+
+def year_column(table, year):
+    # (states, values) for one year of a pivoted table, states without data dropped
+    if year not in table.columns:
+        return np.array([], dtype=object), np.array([])
+    column = table[year].dropna()
+    return column.index.to_numpy(dtype=object), column.to_numpy()
+
+def figure_from_skeleton(skeleton, locations, values, title, extra_traces=(), **layout):
+    trace = dict(skeleton['data'][0], locations=locations, z=values)
+    if 'hovertext' in trace:
+        trace['hovertext'] = locations
+    layout = dict(skeleton['layout'], title={'text': title}, **layout)
+    # the skeleton was validated when px built it, so the copy skips plotly's validation
+    return go.Figure({'data': [trace, *extra_traces], 'layout': layout}, _validate=False)
+
+def choropleth_precip(year, tables=None, territories=False):
+    tables = tables or default_tables()
+    states, values = year_column(tables['precip'], year)
+    fig = figure_from_skeleton(choropleth_skeleton('state_abbr', 'precip', "Precipitation (mm/day)"),
+                               states, values, f"Average GPCP Precipitation (mm/day) in {year}")
     #fig.show()
-    return fig
+    return fit_geometry(fig, territories)
 
 #choropleth_precip(2018)
 
-def choropleth_mental(year):
-    mental['Year'] = pd.to_datetime(mental['Year'], format='%Y')
-    # Filter data for the specified year
-    data_year = mental[mental['Year'].dt.year == year].copy()
-    
-    fig = px.choropleth(data_year,
-                        locations='State',
-                        locationmode='USA-states',
-                        color='MenHealth_MeanValue',
-                        hover_name='State',
-                        color_continuous_scale=px.colors.sequential.Plasma,
-                        title=f"Average Mental Health in {year}",
-                        scope='usa'
-                    )
-    fig.update_layout(coloraxis_colorbar=dict(title="Avg. Poor Mental Health Days"))
+def choropleth_mental(year, states=None, values=None, label="Poor Mental Health Days", tables=None, territories=False):
+    # MENTHLTH from the state-year table by default; another BRFSS metric can be mapped by passing
+    # its per-state yearly means (e.g. a slice of analysis_files.cube.annual_means) and its label
+    if values is None:
+        states, values = year_column((tables or default_tables())['mental'], year)
+    keep = ~np.isnan(values)
+    fig = figure_from_skeleton(choropleth_skeleton('State', 'MenHealth_MeanValue', f"Avg. {label}"),
+                               np.asarray(states, dtype=object)[keep], values[keep],
+                               f"Average {label} in {year}")
     #fig.show()
-    return fig
+    return fit_geometry(fig, territories)
 
 # Example: precomputed state centroids (latitude/longitude) for the 50 U.S. states
 state_centroids = {
@@ -99,59 +161,204 @@ state_centroids = {
     'WY': (42.755966, -107.302490)
 }
 
-def choropleth_combined(year):
-    # Filter and parse date columns
-    precip['time'] = pd.to_datetime(precip['time'], format='%Y-%m-%d')
-    data_year_precip = precip[precip['time'].dt.year == year].copy()
-
-    mental['Year'] = pd.to_datetime(mental['Year'], format='%Y')
-    data_year_mental = mental[mental['Year'].dt.year == year].copy()
-
-    # Merge datasets on state abbreviation
-    merged = pd.merge(data_year_precip, data_year_mental, left_on='state_abbr', right_on='State', how='inner')
+def choropleth_combined(year, tables=None, territories=False):
+    tables = tables or default_tables()
+    # States with both a yearly precipitation and a yearly mental health mean
+    precip_states, precip_values = year_column(tables['precip'], year)
+    mental_states, mental_values = year_column(tables['mental'], year)
+    states, precip_idx, mental_idx = np.intersect1d(precip_states.astype(str), mental_states.astype(str),
+                                                    return_indices=True)
+    if not territories:
+        # the dot sizes are scaled over the states that are drawn
+        drawn = np.isin(states, list(builtin_states))
+        states, precip_idx, mental_idx = states[drawn], precip_idx[drawn], mental_idx[drawn]
+    states = states.astype(object)
+    mh_values = mental_values[mental_idx]
 
     # Get coordinates for each state
-    merged['lat'] = merged['state_abbr'].map(lambda x: state_centroids.get(x, (None, None))[0])
-    merged['lon'] = merged['state_abbr'].map(lambda x: state_centroids.get(x, (None, None))[1])
+    lat = np.array([state_centroids.get(x, (None, None))[0] for x in states], dtype=float)
+    lon = np.array([state_centroids.get(x, (None, None))[1] for x in states], dtype=float)
 
     # Normalize and scale dot size
     min_size = 5
     max_size = 25
-    mh_values = merged['MenHealth_MeanValue'].astype(float)
     mh_scaled = (mh_values - mh_values.min()) / (mh_values.max() - mh_values.min())
     dot_sizes = mh_scaled * (max_size - min_size) + min_size
 
-    # Choropleth: precipitation
-    fig = px.choropleth(
-        merged,
-        locations='state_abbr',
-        locationmode='USA-states',
-        color='precip',
-        scope='usa',
-        color_continuous_scale=px.colors.sequential.Plasma,
-        title=f"Average Precipitation (mm/day) & Mental Health in {year}"
-    )
-
     # Scatter: dot size = mental health
-    fig.add_trace(go.Scattergeo(
-    locationmode='USA-states',
-    lat=merged['lat'],
-    lon=merged['lon'],
-    text=merged['state_abbr'] + "<br>Mental Health: " + merged['MenHealth_MeanValue'].astype(str),
-    marker=dict(
-        size=dot_sizes,
-        color='black',
-        opacity=0.5,
-        symbol='circle'
-    ),
-    name='Mental Health Value'
-))
-
-
-    fig.update_layout(legend_title_text='Precipitation (Color), Mental Health (Dot Size)', geo=dict(scope='usa'))
-    fig.update_layout(coloraxis_colorbar=dict(title="Precipitation (mm/day)"))
+    dots = {
+        'type': 'scattergeo',
+        'locationmode': 'USA-states',
+        'lat': lat,
+        'lon': lon,
+        'text': states + "<br>Mental Health: " + mh_values.astype(str).astype(object),
+        'marker': {'size': dot_sizes, 'color': 'black', 'opacity': 0.5, 'symbol': 'circle'},
+        'name': 'Mental Health Value',
+    }
+
+    # Choropleth: precipitation
+    skeleton = choropleth_skeleton('state_abbr', 'precip', "Precipitation (mm/day)", hover_name=False)
+    fig = figure_from_skeleton(skeleton, states, precip_values[precip_idx],
+                               f"Average Precipitation (mm/day) & Mental Health in {year}",
+                               extra_traces=[dots],
+                               legend=dict(skeleton['layout']['legend'],
+                                           title={'text': 'Precipitation (Color), Mental Health (Dot Size)'}))
     #fig.show()
+    return fit_geometry(fig, territories)
+
+
+def choropleth_correlation(corr_df, year, method='pearson', territories=False):
+    # corr_df comes from analysis_files.correlation.correlate_by_state_year
+    data_year = corr_df[(corr_df['Year'] == year) & (corr_df['Method'] == method)].dropna(subset=['r'])
+
+    fig = px.choropleth(data_year,
+                        locations='State',
+                        locationmode='USA-states',
+                        color='r',
+                        hover_name='State',
+                        hover_data={'State': False, 'r': ':.2f', 'CI_Low': ':.2f',
+                                    'CI_High': ':.2f', 'N': True},
+                        color_continuous_scale=px.colors.diverging.RdBu_r,
+                        range_color=(-1, 1),
+                        title=f"{method.title()} Correlation of Precipitation & Mental Health in {year}",
+                        scope='usa'
+                    )
+    fig.update_layout(coloraxis_colorbar=dict(title=f"{method.title()} r"))
+    return fit_geometry(fig, territories)
+
+
+def choropleth_sensitivity(sens_df, period='', territories=False):
+    # sens_df comes from analysis_files.sensitivity.fit_sensitivity
+    data = sens_df.dropna(subset=['Slope'])
+    limit = data['Slope'].abs().max()
+
+    fig = px.choropleth(data,
+                        locations='State',
+                        locationmode='USA-states',
+                        color='Slope',
+                        hover_name='State',
+                        hover_data={'State': False, 'Slope': ':.2f', 'SE': ':.2f', 'T': ':.2f', 'N': True},
+                        color_continuous_scale=px.colors.diverging.RdBu_r,
+                        range_color=(-limit, limit),
+                        title=f"Precipitation Sensitivity of Mental Health {period}".strip(),
+                        scope='usa'
+                    )
+    fig.update_layout(coloraxis_colorbar=dict(title="Poor MH Days<br>per mm/day"))
+    return fit_geometry(fig, territories)
+
+
+lisa_colors = {
+    'High-High': '#d7191c',
+    'Low-Low': '#2c7bb6',
+    'High-Low': '#fdae61',
+    'Low-High': '#abd9e9',
+}
+
+def add_lisa_overlay(fig, lisa_df):
+    # lisa_df comes from analysis_files.spatial.morans_i; one marker trace per significant cluster type
+    for cluster, color in lisa_colors.items():
+        data = lisa_df[lisa_df['Cluster'] == cluster]
+        if data.empty:
+            continue
+        fig.add_trace(go.Scattergeo(
+            locationmode='USA-states',
+            lat=data['State'].map(lambda x: state_centroids.get(x, (None, None))[0]),
+            lon=data['State'].map(lambda x: state_centroids.get(x, (None, None))[1]),
+            text=data['State'] + "<br>" + cluster + "<br>Local I: " + data['Local_I'].round(2).astype(str)
+                 + "<br>p = " + data['P'].round(3).astype(str),
+            hoverinfo='text',
+            marker=dict(size=14, color=color, symbol='diamond', line=dict(color='black', width=1)),
+            name=cluster
+        ))
+    fig.update_layout(legend_title_text='LISA cluster (p < 0.05)')
     return fig
 
 
-choropleth_combined(2018)
\ No newline at end of file
+def choropleth_date_range(states, values, variable, period, label="Poor Mental Health Days", territories=False):
+    # values: one number per state, e.g. from analysis_files.cube.range_means
+    # label: the BRFSS metric behind mh_mean (see analysis_files.cube.select_metric)
+    data = pd.DataFrame({'State': states, 'Value': values}).dropna()
+    if variable == 'precip':
+        title, colorbar = f"Average GPCP Precipitation (mm/day), {period}", "Precipitation (mm/day)"
+    else:
+        title, colorbar = f"Average {label}, {period}", f"Avg. {label}"
+
+    fig = px.choropleth(data,
+                        locations='State',
+                        locationmode='USA-states',
+                        color='Value',
+                        hover_name='State',
+                        color_continuous_scale=px.colors.sequential.Plasma,
+                        title=title,
+                        scope='usa'
+                    )
+    fig.update_layout(coloraxis_colorbar=dict(title=colorbar))
+    return fit_geometry(fig, territories)
+
+
+period_names = {
+    'Annual': 'Calendar Year', 'WaterYear': 'Water Year (Oct-Sep)',
+    'Q1': 'Q1 (Jan-Mar)', 'Q2': 'Q2 (Apr-Jun)', 'Q3': 'Q3 (Jul-Sep)', 'Q4': 'Q4 (Oct-Dec)',
+    'DJF': 'Winter (DJF)', 'MAM': 'Spring (MAM)', 'JJA': 'Summer (JJA)', 'SON': 'Fall (SON)',
+}
+
+def choropleth_precip_aggregate(agg_df, year, period='Annual', territories=False):
+    # agg_df is aggregate_all() from Precipitation/precip_aggregate.py (the app builds it from the cleaned CSV),
+    # the same table as gpcp_precip_aggregated_by_state_period.csv
+    data_period = agg_df[(agg_df['Year'] == year) & (agg_df['Period'] == period)].copy()
+
+    fig = px.choropleth(data_period,
+                        locations='State',
+                        locationmode='USA-states',
+                        color='AvgPrecip',
+                        hover_name='State',
+                        color_continuous_scale=px.colors.sequential.Plasma,
+                        title=f"Average GPCP Precipitation (mm/day), {period_names.get(period, period)} {year}",
+                        scope='usa'
+                    )
+    fig.update_layout(coloraxis_colorbar=dict(title="Precipitation (mm/day)"))
+    return fit_geometry(fig, territories)
+
+
+def choropleth_anomaly(states, values, year, territories=False):
+    # values: mean standardized precipitation anomaly per state (from gpcp_precip_anomaly.csv)
+    data = pd.DataFrame({'State': states, 'Anomaly': values}).dropna()
+    limit = max(data['Anomaly'].abs().max(), 0.5)
+
+    fig = px.choropleth(data,
+                        locations='State',
+                        locationmode='USA-states',
+                        color='Anomaly',
+                        hover_name='State',
+                        hover_data={'State': False, 'Anomaly': ':.2f'},
+                        color_continuous_scale=px.colors.diverging.BrBG,
+                        range_color=(-limit, limit),
+                        title=f"Precipitation Anomaly vs. Normal in {year}",
+                        scope='usa'
+                    )
+    fig.update_layout(coloraxis_colorbar=dict(title="Std. Anomaly (σ)"))
+    return fit_geometry(fig, territories)
+
+
+def choropleth_county(county_df, geojson, year):
+    # county_df: time, county (GEOID), value rows from cleaningOutput/weather_county_month.csv
+    # geojson: simplified county outlines from geometry_files/geometry.py (feature id = GEOID)
+    in_year = county_df[county_df['time'].dt.year == year]
+    data_year = in_year.groupby('county', observed=True)['value'].mean().reset_index()
+    names = {feature['id']: feature['properties'].get('NAME', feature['id']) for feature in geojson['features']}
+    data_year['Name'] = data_year['county'].map(names)
+
+    fig = px.choropleth(data_year,
+                        geojson=geojson,
+                        locations='county',
+                        color='value',
+                        hover_name='Name',
+                        hover_data={'county': True, 'value': ':.2f'},
+                        color_continuous_scale=px.colors.sequential.Plasma,
+                        title=f"Average GPCP Precipitation (mm/day) by County in {year}",
+                        scope='usa'
+                    )
+    # ~3,200 outlines: thin borders keep the map readable and quick to draw
+    fig.update_traces(marker_line_width=0.2)
+    fig.update_layout(coloraxis_colorbar=dict(title="Precipitation (mm/day)"))
+    return fig
@@ -0,0 +1,79 @@
+import base64
+
+import numpy as np
+import orjson
+import plotly.graph_objects as go
+
+
+def _typed_array(values):
+    # plotly.js typed-array spec: {"dtype": "f4", "bdata": <base64 of the raw little-endian bytes>}
+    values = np.ascontiguousarray(values)
+    spec = {'dtype': values.dtype.str[1:], 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ','.join(map(str, values.shape))
+    return spec
+
+
+def _compact(value, float_type):
+    """
+    Walk a figure dict and send every numeric array as a typed array, with
+    floats narrowed to `float_type`. plotly already base64-encodes numpy
+    arrays, but always as float64 ('f8'); those are decoded and re-encoded.
+    Strings, dates and GeoJSON are left as they are.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'f':
+            return _typed_array(value.astype(float_type))
+        if value.dtype.kind in 'iu':
+            return _typed_array(value)
+        return value.tolist()
+    if isinstance(value, dict):
+        if value.get('dtype') == 'f8' and 'bdata' in value:
+            values = np.frombuffer(base64.b64decode(value['bdata']), dtype='<f8').astype(float_type)
+            if 'shape' in value:
+                values = values.reshape([int(n) for n in value['shape'].split(',')])
+            return _typed_array(values)
+        # a GeoJSON is already plain JSON; walking its coordinates here would cost more than encoding them
+        return {key: item if key == 'geojson' else _compact(item, float_type) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item, float_type) for item in value]
+    return value
+
+
+def figure_spec(fig, float_type=np.float32):
+    """
+    The figure as a plain dict with float32 typed arrays (half the bytes of
+    plotly's float64 ones; 7 significant digits is far beyond what a colour
+    scale, marker size or map position can show). st.plotly_chart accepts
+    the dict directly.
+    """
+    spec = fig.to_plotly_json()
+    return {'data': [_compact(trace, float_type) for trace in spec['data']],
+            'layout': _compact(spec['layout'], float_type)}
+
+
+class SpecFigure(go.Figure):
+    """
+    A finished figure_spec dict wrapped as a plotly Figure, for st.plotly_chart.
+    Given a plain dict, st.plotly_chart validates it by building a full
+    go.Figure (copying and checking every array, ~15 ms for a state map);
+    given a Figure it trusts it and only calls to_dict(), which here hands
+    back the spec as it is. The spec is not copied, so don't change it after.
+    """
+
+    def __init__(self, spec):
+        super().__init__()
+        self._spec = spec
+
+    def to_dict(self):
+        return self._spec
+
+
+def figure_json(fig, float_type=np.float32):
+    """
+    figure_spec serialized with orjson. Skips plotly.io's generic per-value
+    cleaning pass, which is most of the cost for figures carrying a GeoJSON.
+    Returns bytes.
+    """
+    return orjson.dumps(figure_spec(fig, float_type),
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
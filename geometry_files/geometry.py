@@ -0,0 +1,96 @@
+import functools
+import json
+import os
+import sys
+
+import numpy as np
+
+# Shapefiles for each layer, paths relative to the repo root. The county file is not in the repo;
+# download cb_2018_us_county_20m from the Census cartographic boundary files into Precipitation/
+layers = {
+    'states': {'shapefile': './Precipitation/cb_2018_us_state_20m/cb_2018_us_state_20m.shp', 'id_column': 'STUSPS'},
+    'counties': {'shapefile': './Precipitation/cb_2018_us_county_20m/cb_2018_us_county_20m.shp', 'id_column': 'GEOID'},
+}
+county_shapefile = layers['counties']['shapefile']
+
+# Simplification for whole-country maps (every map the app draws): tolerance in degrees
+# (~1 pixel at 900 px wide) and coordinate decimals
+tolerance = 0.05
+decimals = 2
+geojson_dir = './cleaningOutput/geojson'
+
+
+def geojson_path(layer):
+    return os.path.join(geojson_dir, f"{layer}.geojson")
+
+
+# county outlines the app checks for before offering the county view
+county_geojson = geojson_path('counties')
+
+
+def simplified_features(regions, id_column, tolerance=0.01, decimals=3, properties=('NAME',)):
+    """
+    GeoJSON FeatureCollection (as a dict) of `regions` with simplified,
+    quantized geometry, for plotly's geojson= argument.
+    • tolerance : simplification tolerance in degrees (0.01 ≈ 1 km)
+    • decimals  : coordinates are snapped to a 10^-decimals degree grid and
+                  written with that many decimals, so the file stays small
+    The polygons are simplified as one coverage, so a border shared by two
+    regions is simplified once and stays shared (no gaps or slivers).
+    Each feature's id is the value of `id_column` (state abbreviation, county
+    GEOID), which is what px.choropleth matches `locations` against.
+    """
+    import shapely
+    regions = regions.to_crs("EPSG:4326")
+    geoms = regions.geometry.to_numpy()
+    # Alaska's Aleutians cross the antimeridian; keep the western-hemisphere part so the
+    # outline doesn't stretch across the whole map
+    spans = shapely.bounds(geoms)
+    crossing = (spans[:, 0] < -170) & (spans[:, 2] > 170)
+    geoms[crossing] = shapely.intersection(geoms[crossing], shapely.box(-180, -90, 0, 90))
+
+    geoms = shapely.coverage_simplify(geoms, tolerance)
+    # snapping keeps polygons valid; rounding afterwards only cleans up the float repr
+    geoms = shapely.set_precision(geoms, 10.0 ** -decimals)
+    geoms = shapely.set_coordinates(geoms, np.round(shapely.get_coordinates(geoms), decimals))
+
+    features = []
+    for region_id, geom, props in zip(regions[id_column].astype(str), geoms,
+                                      regions[list(properties)].to_dict('records')):
+        if geom is None or shapely.is_empty(geom):
+            continue
+        features.append({'type': 'Feature', 'id': region_id, 'properties': props,
+                         'geometry': json.loads(shapely.to_geojson(geom))})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def build_geojson(layer):
+    """
+    Simplify a layer's shapefile and write the result to
+    cleaningOutput/geojson/<layer>.geojson. Returns the file size in bytes.
+    """
+    import geopandas as gpd
+    spec = layers[layer]
+    regions = gpd.read_file(spec['shapefile'])
+    os.makedirs(geojson_dir, exist_ok=True)
+    collection = simplified_features(regions, spec['id_column'], tolerance, decimals)
+    with open(geojson_path(layer), 'w') as f:
+        json.dump(collection, f, separators=(',', ':'))
+    return os.path.getsize(geojson_path(layer))
+
+
+@functools.lru_cache(maxsize=None)
+def load_geojson(layer='counties'):
+    # Cached GeoJSON for a layer, built from the shapefile the first time.
+    # Kept in memory, so every figure after the first reuses the same parsed dict.
+    path = geojson_path(layer)
+    if not os.path.exists(path):
+        build_geojson(layer)
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    # python -m geometry_files.geometry [states|counties ...]
+    for layer in sys.argv[1:] or ['states']:
+        print(layer, f"{build_geojson(layer) / 1e3:.0f} kB")
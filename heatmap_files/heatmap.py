@@ -1,5 +1,12 @@
+import warnings
+
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from analysis_files.cube import metrics
+
+month_names = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], dtype=object)
 
 class HeatmapVisualizer:
     def __init__(self, precipitation_df, mental_health_df, decoder_df,
@@ -19,8 +26,8 @@ class HeatmapVisualizer:
         mental_health_df['Date'] = pd.to_datetime(
             dict(year=mental_health_df.IYEAR, month=mental_health_df.IMONTH, day=1)
         )
-        # Filter and select the required mental health columns
-        mh_df_filtered = mental_health_df[['Date', 'MENTHLTH', '_STATE']]
+        # Filter and select the required mental health columns (every BRFSS metric the data has)
+        mh_df_filtered = mental_health_df[['Date'] + [m for m in metrics if m in mental_health_df.columns] + ['_STATE']]
         mh_df_filtered = mh_df_filtered[mh_df_filtered['_STATE'].isin(decoder_df['_STATE'])]
         # Merge with the decoder for state abbreviation
         mh_df_filtered = mh_df_filtered.merge(decoder_df, on='_STATE', how='left')
@@ -55,78 +62,221 @@ class HeatmapVisualizer:
                   state='US',
                   n_bins=10,
                   binning=False,
-                  colorscale=None):
+                  colorscale=None,
+                  metric='MENTHLTH'):
         """
         year    : int
         state   : 'US' or two-letter code
-        n_bins  : only used if binning=True
-        binning : if False, we pivot on raw precip values
+        n_bins  : only used if binning is on
+        binning : False  -> one row per raw precip value (grows with the data)
+                  True / 'fixed' -> n_bins equal-width bins
+                  'quantile'     -> n_bins bins holding about the same number of rows
+                  Bin edges come from the whole dataset and are computed once
+                  (see bin_edges), so every year/state shares the same rows and
+                  the matrix is always n_bins x 12.
+        metric  : BRFSS column averaged in each cell (MENTHLTH, PHYSHLTH,
+                  POORHLTH or GENHLTH); answers outside its valid range are skipped
         """
-        df = self.combined_df.copy()
-        df_year = df[df['time'].dt.year == year].copy()
+        arrays = self.arrays()
+        in_year = arrays['year'] == year
 
         # aggregate for US or filter for a single state
         if state.upper() == 'US':
-            df_plot = (df_year
-                       .groupby('time')[['precip','MENTHLTH']]
-                       .mean()
-                       .reset_index()).copy()
+            # monthly means over all rows of the year (NaNs skipped, like groupby().mean())
+            month_idx, precip, mh = arrays['month'][in_year], arrays['precip'][in_year], arrays['metrics'][metric][in_year]
+            present = np.flatnonzero(np.bincount(month_idx, minlength=12))
+            precip, mh = (monthly_mean(month_idx, values)[present] for values in (precip, mh))
+            month_idx = present
         else:
-            df_plot = df_year[df_year['state_abbr'] == state.upper()].copy()
+            rows = in_year & (arrays['state'] == arrays['state_codes'].get(state.upper(), -1))
+            month_idx, precip, mh = arrays['month'][rows], arrays['precip'][rows], arrays['metrics'][metric][rows]
 
-        if df_plot.empty or df_plot['precip'].notna().sum() == 0 or df_plot['MENTHLTH'].notna().sum() == 0:
+        if len(precip) == 0 or np.isnan(precip).all() or np.isnan(mh).all():
             return None
 
-        # month names in calendar order
-        df_plot['Month'] = df_plot['time'].dt.month_name().str[:3]
-        month_order = ['Jan','Feb','Mar','Apr','May','Jun',
-                       'Jul','Aug','Sep','Oct','Nov','Dec']
-        df_plot['Month'] = pd.Categorical(df_plot['Month'],
-                                          categories=month_order,
-                                          ordered=True)
-
+        ok = ~(np.isnan(precip) | np.isnan(mh))
+        month_idx, precip, mh = month_idx[ok], precip[ok], mh[ok]
         if binning:
-            # --- your existing code ---
-            df_plot['precip_bin'] = pd.cut(df_plot['precip'], bins=n_bins)
-            agg = (df_plot
-                   .groupby(['precip_bin','Month'], observed=False)['MENTHLTH']
-                   .mean()
-                   .reset_index(name='avg_menthlth'))
-            mat = agg.pivot(index='precip_bin',
-                            columns='Month',
-                            values='avg_menthlth')
-            y_labels = [f"{iv.left:.0f}–{iv.right:.0f}" for iv in mat.index]
+            # fixed n_bins x 12 matrix
+            months = np.arange(12)
+            edges = self.bin_edges('quantile' if binning == 'quantile' else 'fixed', n_bins)
+            row = np.clip(np.searchsorted(edges, precip, side='right') - 1, 0, len(edges) - 2)
+            n_rows = len(edges) - 1
+            y_labels = [f"{left:.1f}–{right:.1f}" for left, right in zip(edges[:-1], edges[1:])]
         else:
-            # pivot on the raw precipitation values
-            mat = df_plot.pivot_table(
-                index = 'precip',
-                columns = 'Month',
-                values = 'MENTHLTH',
-                aggfunc = 'mean',
-                observed=False
-            )
-            # use the numeric precip values as y-labels
-            y_labels = [f"{p:.1f}" for p in mat.index]
+            # one row per raw precipitation value, only the months that have data
+            months = np.unique(month_idx)
+            values, row = np.unique(precip, return_inverse=True)
+            n_rows = len(values)
+            y_labels = [f"{p:.1f}" for p in values]
+
+        # mean MH days per (row, month) cell: two bincounts over the flattened cell index
+        cell = row * 12 + month_idx
+        sums = np.bincount(cell, weights=mh, minlength=n_rows * 12)
+        counts = np.bincount(cell, minlength=n_rows * 12)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (sums / counts).reshape(n_rows, 12)[:, months]
 
         # build the heatmap
         fig = go.Figure(go.Heatmap(
-            z=mat.values,
-            x=mat.columns,
+            z=z,
+            x=month_names[months],
             y=y_labels,
             colorscale=colorscale or self.cmap,
-            colorbar=dict(title="Avg Poor MH Days"),
+            colorbar=dict(title=f"Avg {metrics[metric]['short']}"),
             hovertemplate=(
                 "Precip: %{y} mm<br>"
                 "Month: %{x}<br>"
-                "Avg Poor MH Days: %{z:.2f}<extra></extra>"
+                f"Avg {metrics[metric]['short']}: %{{z:.2f}}<extra></extra>"
             )
         ))
 
         fig.update_layout(
-            title=f"{self.title} — {state.upper()} {year}",
+            # the visualizer's title describes MENTHLTH; other metrics name themselves
+            title=f"{self.title if metric == 'MENTHLTH' else 'Precipitation ↔ ' + metrics[metric]['label']} — {state.upper()} {year}",
             xaxis_title="Month",
             yaxis_title="Precipitation (mm/day)",
             xaxis_tickangle=-45,
             height=400
         )
-        return fig
\ No newline at end of file
+        return fig
+
+    def arrays(self):
+        # Columns of combined_df as NumPy arrays, extracted once per visualizer
+        if not hasattr(self, '_arrays'):
+            df = self.combined_df
+            # states as integer codes: comparing ints is much cheaper than strings on large tables
+            state, codes = pd.factorize(df['state_abbr'])
+            self._arrays = {
+                'year': df['time'].dt.year.to_numpy(),
+                'month': df['time'].dt.month.to_numpy() - 1,
+                'state': state,
+                'state_codes': {code: i for i, code in enumerate(codes)},
+                'precip': df['precip'].to_numpy(dtype=float),
+                # every metric column, with answers outside its valid range (e.g. GENHLTH 7 / 9) as NaN
+                'metrics': {name: df[name].where(df[name].between(*metrics[name]['valid'])).to_numpy(dtype=float)
+                            for name in metrics if name in df.columns},
+            }
+        return self._arrays
+
+    def bin_edges(self, method='fixed', n_bins=10):
+        """
+        Precipitation bin edges over the whole dataset, cached per (method, n_bins).
+        fixed    : n_bins equal-width bins between the smallest and largest value
+        quantile : edges at the 0, 1/n_bins, ..., 1 quantiles (duplicates merged,
+                   so heavily repeated values can give fewer bins)
+        """
+        if not hasattr(self, '_edges'):
+            self._edges = {}
+        if (method, n_bins) not in self._edges:
+            precip = self.arrays()['precip']
+            precip = precip[~np.isnan(precip)]
+            if method == 'quantile':
+                edges = np.unique(np.quantile(precip, np.linspace(0, 1, n_bins + 1)))
+            else:
+                edges = np.linspace(precip.min(), precip.max(), n_bins + 1)
+            self._edges[(method, n_bins)] = edges
+        return self._edges[(method, n_bins)]
+
+
+def monthly_mean(month_idx, values):
+    # mean of `values` per calendar month (0-11), NaNs skipped, NaN for months without data
+    ok = ~np.isnan(values)
+    counts = np.bincount(month_idx[ok], minlength=12)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.bincount(month_idx[ok], weights=values[ok], minlength=12) / counts
+
+
+def lag_heatmap(lag_df, title="Precipitation → Mental Health Lagged Correlation", colorscale='RdBu_r'):
+    """
+    lag_df : output of analysis_files.lag.lag_correlations
+             (one row per State x Lag with the correlation in `r`)
+    """
+    mat = lag_df.pivot(index='State', columns='Lag', values='r').sort_index(ascending=False)
+    n = lag_df.pivot(index='State', columns='Lag', values='N').reindex_like(mat)
+
+    fig = go.Figure(go.Heatmap(
+        z=mat.values,
+        x=[f"{lag} mo" for lag in mat.columns],
+        y=mat.index,
+        customdata=n.values,
+        colorscale=colorscale,
+        zmin=-1, zmax=1, zmid=0,
+        colorbar=dict(title="Pearson r"),
+        hovertemplate=(
+            "State: %{y}<br>"
+            "Lag: %{x}<br>"
+            "r: %{z:.2f}<br>"
+            "Months: %{customdata}<extra></extra>"
+        )
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="Months between precipitation and mental health",
+        yaxis_title="State",
+        height=900
+    )
+    return fig
+
+
+# Panels of the all-states overview: cube array -> (panel title, colorbar title, colorscale)
+overview_panels = {
+    'mh_mean': ("Poor Mental Health Days", "Average", 'Reds'),
+    'precip': ("Precipitation", "mm/day", 'Blues'),
+}
+
+
+def standardize_rows(values):
+    # z-score of every row (state) over its own months, NaNs ignored; rows with no spread stay NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(values, axis=1, keepdims=True)
+        std = np.nanstd(values, axis=1, keepdims=True)
+    return (values - mean) / np.where(std > 0, std, np.nan)
+
+
+def state_month_heatmap(cube, variables=('mh_mean', 'precip'), standardize=False,
+                        title="Every State, Every Month", metric='MENTHLTH'):
+    """
+    State x month overview of the monthly cube: one heatmap per variable,
+    side by side with a shared state axis (small multiples).
+    • cube        : dict from analysis_files.cube (states, months, and (S, T) arrays)
+    • variables   : cube arrays to draw, keys of `overview_panels`
+    • standardize : z-score each state over its own months, so states with
+                    very different levels can be compared by their swings
+    • metric      : BRFSS metric behind mh_mean, for the labels (pass the cube
+                    through analysis_files.cube.select_metric to switch it)
+    The cube is already dense, so each panel is its (S, T) array as is; the
+    figure is assembled as a plain dict without plotly's validation.
+    """
+    states = cube['states'][::-1]   # AK at the top
+    months = np.datetime_as_string(cube['months'], unit='M')
+    gap = 0.06
+    width = (1 - gap * (len(variables) - 1)) / len(variables)
+
+    data, layout = [], {}
+    for i, variable in enumerate(variables):
+        panel_title, colorbar_title, colorscale = overview_panels[variable]
+        if variable == 'mh_mean':
+            panel_title = metrics[metric]['label']
+        trace = {'type': 'heatmap', 'z': cube[variable][::-1]}
+        if standardize:
+            trace.update(z=standardize_rows(trace['z']), zmid=0)
+            colorbar_title, colorscale = "z-score", 'RdBu_r'
+        suffix = str(i + 1) if i else ''
+        left = i * (width + gap)
+        trace.update({
+            'x': months, 'y': states, 'xaxis': 'x' + suffix, 'yaxis': 'y', 'colorscale': colorscale,
+            'colorbar': {'title': {'text': colorbar_title}, 'x': left + width, 'xanchor': 'left',
+                         'len': 0.45, 'y': 1 - i * 0.5, 'yanchor': 'top', 'thickness': 12},
+            'hovertemplate': f"State: %{{y}}<br>Month: %{{x}}<br>{panel_title}: %{{z:.2f}}<extra></extra>",
+        })
+        data.append(trace)
+        layout['xaxis' + suffix] = {'domain': [left, left + width], 'title': {'text': panel_title},
+                                    'tickangle': -45, 'nticks': 12}
+    layout['yaxis'] = {'title': {'text': 'State'}, 'dtick': 1, 'tickfont': {'size': 9}}
+    layout.update(title={'text': title + (" (standardized per state)" if standardize else "")},
+                  height=900)
+    return go.Figure({'data': data, 'layout': layout}, _validate=False)
+
@@ -1,8 +1,22 @@
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
 import plotly.graph_objects as go
+from analysis_files.cube import metrics
+
+month_names = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], dtype=object)
 
 class ScatterplotVisualizer:
+    # Level of detail for large states/years, counted in distinct markers (respondents with the same
+    # month, precipitation and answer draw one marker): up to webgl_threshold markers draw as SVG,
+    # up to density_threshold as WebGL, above that the points are binned server-side into
+    # (month x precipitation) cells. The shipped data has at most ~200 distinct markers per
+    # state-year (1,354 respondents), so WebGL kicks in for the largest states and binning only
+    # once there are more markers than the 12 x density_bins cells it can draw
+    webgl_threshold = 150
+    density_bins = 40
+    density_threshold = 12 * density_bins
+
     def __init__(self, precipitation_df, mental_health_df, decoder_df,
                  title="Precipitation ↔ Mental Health (MH) Heatmap", cmap="greys"):
         # Store provided dataframes and compute the combined normalized dataframe
@@ -20,8 +34,8 @@ class ScatterplotVisualizer:
         mental_health_df['Date'] = pd.to_datetime(
             dict(year=mental_health_df.IYEAR, month=mental_health_df.IMONTH, day=1)
         )
-        # Filter and select the required mental health columns
-        mh_df_filtered = mental_health_df[['Date', 'MENTHLTH', '_STATE']]
+        # Filter and select the required mental health columns (every BRFSS metric the data has)
+        mh_df_filtered = mental_health_df[['Date'] + [m for m in metrics if m in mental_health_df.columns] + ['_STATE']]
         mh_df_filtered = mh_df_filtered[mh_df_filtered['_STATE'].isin(decoder_df['_STATE'])]
         # Merge with the decoder for state abbreviation
         mh_df_filtered = mh_df_filtered.merge(decoder_df, on='_STATE', how='left')
@@ -55,7 +69,9 @@ class ScatterplotVisualizer:
                   year,
                   state='US',
                   colorscale=None,
-                  size_range=(10, 50)):
+                  size_range=(10, 50),
+                  lod='auto',
+                  metric='MENTHLTH'):
         """
         If as_scatter=True, draw a scatterplot:
           • x = Month
@@ -63,60 +79,210 @@ class ScatterplotVisualizer:
           • marker.size ~ MENTHLTH (scaled to `size_range`)
           • marker.color  ~ MENTHLTH (optional, shows colorbar)
         Otherwise draws the 2D heatmap as before.
+        lod picks the level of detail: 'points' draws every distinct marker
+        (WebGL above webgl_threshold), 'density' bins them (see density_figure),
+        'auto' switches to density above density_threshold distinct markers.
+        metric is the BRFSS column behind size / color (MENTHLTH, PHYSHLTH,
+        POORHLTH or GENHLTH); switching it only picks another cached array.
         """
-        df = self.combined_df.copy()
-        df_year = df[df['time'].dt.year == year].copy()
+        arrays = self.arrays()
+        in_year = arrays['year'] == year
 
         # US‐aggregate vs state
         if state.upper() == 'US':
-            df_plot = (df_year
-                       .groupby('time')[['precip','MENTHLTH']]
-                       .mean().reset_index())
+            # monthly means over all rows of the year (NaNs skipped, like groupby().mean())
+            month_idx = arrays['month'][in_year]
+            precip = arrays['precip'][in_year]
+            mh = arrays['metrics'][metric][in_year]
+            ok_p, ok_m = ~np.isnan(precip), ~np.isnan(mh)
+            counts_p = np.bincount(month_idx[ok_p], minlength=12)
+            counts_m = np.bincount(month_idx[ok_m], minlength=12)
+            present = np.flatnonzero(np.bincount(month_idx, minlength=12))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                precip = (np.bincount(month_idx[ok_p], weights=precip[ok_p], minlength=12) / counts_p)[present]
+                mh = (np.bincount(month_idx[ok_m], weights=mh[ok_m], minlength=12) / counts_m)[present]
+            month_idx = present
         else:
-            df_plot = df_year[df_year['state_abbr'] == state.upper()].copy()
+            # respondents without a valid answer for this metric are left out
+            rows = in_year & (arrays['state'] == state.upper()) & ~np.isnan(arrays['metrics'][metric])
+            month_idx, precip, mh = arrays['month'][rows], arrays['precip'][rows], arrays['metrics'][metric][rows]
 
         # bail if no data
-        if df_plot.empty or df_plot[['precip','MENTHLTH']].dropna().empty:
+        both = ~(np.isnan(precip) | np.isnan(mh))
+        if len(precip) == 0 or not both.any():
             return None
 
-        # add Month column
-        df_plot['Month'] = df_plot['time'].dt.month_name().str[:3]
-        month_order = ['Jan','Feb','Mar','Apr','May','Jun',
-                       'Jul','Aug','Sep','Oct','Nov','Dec']
-        df_plot['Month'] = pd.Categorical(df_plot['Month'],
-                                          categories=month_order,
-                                          ordered=True)
+        # respondents with the same month, precipitation and MH days draw the exact same
+        # marker; keep one of each so the figure doesn't carry thousands of hidden points
+        _, first = np.unique(np.stack([month_idx, np.nan_to_num(precip, nan=-1.0), np.nan_to_num(mh, nan=-1.0)]),
+                             axis=1, return_index=True)
+        # the level of detail follows the markers actually drawn, not the respondent count
+        if lod == 'density' or (lod == 'auto' and len(first) > self.density_threshold):
+            return self.density_figure(month_idx, precip, mh, colorscale or self.cmap, size_range,
+                                       self.figure_title(state, year, metric), metric)
+        first = np.sort(first)
+        month_idx, precip, mh = month_idx[first], precip[first], mh[first]
 
         # --- SCATTER PATH ---
-        # scale mental‐health days to marker sizes
-        scaler = MinMaxScaler(feature_range=size_range)
-        # reshape for scaler
-        mh_vals = df_plot['MENTHLTH'].to_numpy().reshape(-1,1)
-        sizes  = scaler.fit_transform(mh_vals).flatten()
-
-        fig = go.Figure(go.Scatter(
-            x=df_plot['Month'],
-            y=df_plot['precip'],
-            mode='markers',
-            marker=dict(
-                size=sizes,
-                color=df_plot['MENTHLTH'],
-                colorscale=colorscale or self.cmap,
-                showscale=True,
-                colorbar=dict(title="Avg Poor MH Days")
-            ),
-            hovertemplate=(
-                "Month: %{x}<br>"
-                "Precip: %{y:.2f} mm/day<br>"
-                "Avg MH Days: %{marker.color:.1f}<extra></extra>"
+        # scale mental‐health days to marker sizes (min -> size_range[0], max -> size_range[1])
+        low, high = np.nanmin(mh), np.nanmax(mh)
+        scale = (high - low) if high > low else 1.0
+        sizes = (mh - low) / scale * (size_range[1] - size_range[0]) + size_range[0]
+
+        skeleton = self.skeleton(colorscale or self.cmap, metric)
+        trace = dict(skeleton['data'][0], x=month_names[month_idx], y=precip,
+                     marker=dict(skeleton['data'][0]['marker'], size=sizes, color=mh))
+        if len(precip) > self.webgl_threshold:
+            # thousands of SVG nodes stall the browser; WebGL draws the same markers on the GPU
+            trace['type'] = 'scattergl'
+        layout = dict(skeleton['layout'], title={'text': self.figure_title(state, year, metric)})
+        # the skeleton was validated once, so the copy skips plotly's validation
+        return go.Figure({'data': [trace], 'layout': layout}, _validate=False)
+
+    def figures(self, years=None, states=None, **kwargs):
+        """
+        visualize() for every (year, state) pair, built up front so a linked
+        view can swap between them without touching the data again.
+        • years / states : defaults to every year and state in combined_df
+        • kwargs         : passed on to visualize (colorscale, size_range, lod, metric)
+        Returns {(year, state): figure, or None when there is no data}.
+        """
+        arrays = self.arrays()
+        years = np.unique(arrays['year']) if years is None else years
+        states = pd.unique(arrays['state'][pd.notna(arrays['state'])]) if states is None else states
+        return {(int(year), state): self.visualize(year=year, state=state, **kwargs)
+                for year in years for state in states}
+
+    def figure_title(self, state, year, metric):
+        # the visualizer's title describes MENTHLTH; other metrics name themselves
+        name = self.title if metric == 'MENTHLTH' else f"Monthly Precip vs. {metrics[metric]['label']}"
+        return f"{name} — {state.upper()} {year}"
+
+    def density_figure(self, month_idx, precip, mh, colorscale, size_range, title, metric='MENTHLTH'):
+        """
+        Server-side 2D histogram for very large selections: points are counted
+        in (month x precipitation bin) cells with bincount and each non-empty
+        cell becomes one marker at the bin centre, sized by the number of
+        respondents and coloured by their mean MH days. At most
+        12 x density_bins markers are sent, however many rows there are.
+        """
+        ok = ~(np.isnan(precip) | np.isnan(mh))
+        month_idx, precip, mh = month_idx[ok], precip[ok], mh[ok]
+        edges = np.linspace(precip.min(), precip.max(), self.density_bins + 1)
+        if edges[-1] == edges[0]:
+            edges = edges[0] + np.arange(self.density_bins + 1) - self.density_bins / 2
+        precip_bin = np.clip(np.searchsorted(edges, precip, side='right') - 1, 0, self.density_bins - 1)
+
+        cell = month_idx * self.density_bins + precip_bin
+        counts = np.bincount(cell, minlength=12 * self.density_bins)
+        mh_sums = np.bincount(cell, weights=mh, minlength=12 * self.density_bins)
+        used = np.flatnonzero(counts)
+        centres = (edges[:-1] + edges[1:]) / 2
+
+        # marker area ~ number of respondents
+        radius = np.sqrt(counts[used] / counts[used].max())
+        sizes = size_range[0] + radius * (size_range[1] - size_range[0])
+
+        skeleton = self.skeleton(colorscale, metric)
+        trace = dict(skeleton['data'][0],
+                     x=month_names[used // self.density_bins],
+                     y=centres[used % self.density_bins],
+                     customdata=counts[used],
+                     marker=dict(skeleton['data'][0]['marker'], size=sizes, color=mh_sums[used] / counts[used]),
+                     hovertemplate=("Month: %{x}<br>"
+                                    "Precip: %{y:.2f} mm/day (bin centre)<br>"
+                                    "Respondents: %{customdata}<br>"
+                                    f"Avg {metrics[metric]['short']}: %{{marker.color:.1f}}<extra></extra>"))
+        layout = dict(skeleton['layout'], title={'text': f"{title} (binned, {len(precip):,} respondents)"})
+        return go.Figure({'data': [trace], 'layout': layout}, _validate=False)
+
+    def arrays(self):
+        # Columns of combined_df as NumPy arrays, extracted once per visualizer
+        if not hasattr(self, '_arrays'):
+            df = self.combined_df
+            self._arrays = {
+                'year': df['time'].dt.year.to_numpy(),
+                'month': df['time'].dt.month.to_numpy() - 1,
+                'state': df['state_abbr'].to_numpy(dtype=object),
+                'precip': df['precip'].to_numpy(dtype=float),
+                # every metric column, with answers outside its valid range (e.g. GENHLTH 7 / 9) as NaN
+                'metrics': {name: df[name].where(df[name].between(*metrics[name]['valid'])).to_numpy(dtype=float)
+                            for name in metrics if name in df.columns},
+            }
+        return self._arrays
+
+    def skeleton(self, colorscale, metric='MENTHLTH'):
+        # Layout, colorbar and hover text built and validated once per colorscale and metric
+        if not hasattr(self, '_skeletons'):
+            self._skeletons = {}
+        if (colorscale, metric) not in self._skeletons:
+            short = metrics[metric]['short']
+            fig = go.Figure(go.Scatter(
+                x=['Jan'],
+                y=[0.0],
+                mode='markers',
+                marker=dict(
+                    size=[0.0],
+                    color=[0.0],
+                    colorscale=colorscale,
+                    showscale=True,
+                    colorbar=dict(title=f"Avg {short}")
+                ),
+                hovertemplate=(
+                    "Month: %{x}<br>"
+                    "Precip: %{y:.2f} mm/day<br>"
+                    f"Avg {short}: %{{marker.color:.1f}}<extra></extra>"
+                )
+            ))
+            fig.update_layout(
+                title=self.title,
+                xaxis_title="Month",
+                yaxis_title="Precipitation (mm/day)",
+                xaxis_tickangle=-45,
+                height=400
             )
-        ))
-
-        fig.update_layout(
-            title=f"{self.title} — {state.upper()} {year}",
-            xaxis_title="Month",
-            yaxis_title="Precipitation (mm/day)",
-            xaxis_tickangle=-45,
-            height=400
+            self._skeletons[(colorscale, metric)] = fig.to_plotly_json()
+        return self._skeletons[(colorscale, metric)]
+
+def anomaly_scatter(states, months, anomaly, mh_mean, title="Precipitation Anomaly vs. Poor Mental Health Days",
+                    colorscale='BrBG', metric='MENTHLTH'):
+    """
+    One marker per state-month:
+      • x = standardized precipitation anomaly (σ from that state's normal for the month)
+      • y = mean MENTHLTH (or the BRFSS `metric` mh_mean was taken from, for the labels)
+    states / months are the labels of each point, all inputs are 1-D and aligned.
+    """
+    keep = ~(np.isnan(anomaly) | np.isnan(mh_mean))
+    if not keep.any():
+        return None
+    labels = np.char.add(np.char.add(np.asarray(states)[keep].astype(str), ' '),
+                         np.datetime_as_string(np.asarray(months)[keep], unit='M'))
+
+    fig = go.Figure(go.Scatter(
+        x=anomaly[keep],
+        y=mh_mean[keep],
+        mode='markers',
+        text=labels,
+        marker=dict(
+            size=9,
+            color=anomaly[keep],
+            colorscale=colorscale,
+            cmid=0,
+            showscale=True,
+            colorbar=dict(title="Std. Anomaly (σ)"),
+            line=dict(color='grey', width=0.5)
+        ),
+        hovertemplate=(
+            "%{text}<br>"
+            "Precip anomaly: %{x:.2f} σ<br>"
+            f"Avg {metrics[metric]['short']}: %{{y:.1f}}<extra></extra>"
         )
-        return fig
\ No newline at end of file
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="Precipitation anomaly (standard deviations from normal)",
+        yaxis_title=f"Avg. {metrics[metric]['label']}",
+        height=400
+    )
+    return fig
@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # the app reads its data relative to the repo root
+    monkeypatch.chdir(root)
+    at = AppTest.from_file(os.path.join(root, 'app.py'), default_timeout=300)
+    return at.run()
+
+
+@pytest.mark.parametrize('chart', ["Choropleth - Precipitation", "Choropleth - Mental Health", "Choropleth - Combined"])
+def test_linked_choropleth_renders(app, chart):
+    # app.py sends these maps as SpecFigure, which relies on st.plotly_chart only calling to_dict()
+    # on a Figure (checked with the versions pinned in requirements.txt)
+    app.sidebar.selectbox[0].select(chart)
+    app.run()
+    assert not app.exception
+    chart_element = app.get('plotly_chart')[0].proto
+    spec = json.loads(chart_element.spec)
+    choropleth = [trace for trace in spec['data'] if trace['type'] == 'choropleth']
+    assert len(choropleth) == 1 and len(choropleth[0]['locations']) >= 48
+    assert 'geo' in spec['layout'] and spec['layout']['title']['text']
+    # clicking a state selects it (the linked drill-down)
+    assert chart_element.selection_mode
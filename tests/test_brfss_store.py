@@ -0,0 +1,80 @@
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from brfss_store import (columns_needed, filter_valid_vals, fips_to_abbrev, ingest, merged_stats, partition_stats,
+                          state_year_means, write_combined)
+
+
+def write_year(source, year, seed, n=300):
+    # one survey year's raw CSVs: extra columns, some non-residents and invalid answers,
+    # and interviews dated the next year, like the real releases
+    rng = np.random.default_rng(seed)
+    folder = source / str(year)
+    folder.mkdir(parents=True, exist_ok=True)
+    for part in range(2):
+        rows = pd.DataFrame({
+            '_STATE': rng.choice([1, 6, 53, 72], n), 'IMONTH': rng.integers(1, 13, n),
+            'IYEAR': np.where(rng.random(n) < 0.1, year + 1, year), 'DISPCODE': 1100,
+            'STATERE1': rng.choice([1, 1, 1, 2], n), 'SEQNO': np.arange(n),
+            '_LLCPWT': rng.random(n) * 100, '_STSTR': rng.integers(1, 5, n), '_PSU': rng.integers(1, 20, n),
+        })
+        for name in ['GENHLTH', 'PHYSHLTH', 'MENTHLTH', 'POORHLTH']:
+            rows[name] = rng.choice([1, 2, 5, 10, 30, 77, 88], n)
+        rows.to_csv(folder / f"part_{part}.csv", index=False)
+
+
+def test_incremental_ingest_matches_full_ingest(tmp_path):
+    source = tmp_path / 'source'
+    write_year(source, 2018, seed=1)
+    write_year(source, 2019, seed=2)
+
+    # full: both years at once
+    full = tmp_path / 'full'
+    assert ingest(str(source), str(full)) == ['2018', '2019']
+
+    # incremental: 2018 first, then 2019 arrives; 2018 is not processed again
+    partial_source = tmp_path / 'partial'
+    write_year(partial_source, 2018, seed=1)
+    incremental = tmp_path / 'incremental'
+    assert ingest(str(partial_source), str(incremental)) == ['2018']
+    write_year(partial_source, 2019, seed=2)
+    assert ingest(str(partial_source), str(incremental)) == ['2019']
+    assert ingest(str(partial_source), str(incremental)) == []
+
+    pdt.assert_frame_equal(merged_stats(str(incremental)), merged_stats(str(full)))
+    write_combined(str(tmp_path / 'full.csv'), str(full))
+    write_combined(str(tmp_path / 'incremental.csv'), str(incremental))
+    assert filecmp.cmp(tmp_path / 'full.csv', tmp_path / 'incremental.csv', shallow=False)
+
+
+def test_merged_stats_match_the_filtered_rows(tmp_path):
+    source = tmp_path / 'source'
+    write_year(source, 2018, seed=3)
+    write_year(source, 2019, seed=4)
+    ingest(str(source), str(tmp_path / 'store'))
+
+    raw = pd.concat([pd.read_csv(path, usecols=lambda c: c in columns_needed)
+                     for path in sorted(source.glob('*/*.csv'))], ignore_index=True)
+    valid = filter_valid_vals(raw)
+    stats = merged_stats(str(tmp_path / 'store'))
+    # (State, IYEAR) = 2019 draws on both the 2018 and the 2019 partition
+    expected = partition_stats(valid).sort_values(['State', 'IYEAR', 'IMONTH'], ignore_index=True)
+    pdt.assert_frame_equal(stats, expected, check_dtype=False)
+
+    means = state_year_means(stats).set_index(['State', 'Year'])['MenHealth_MeanValue'].sort_index()
+    expected = valid.groupby([valid['_STATE'].map(fips_to_abbrev), 'IYEAR'])['MENTHLTH'].mean()
+    np.testing.assert_allclose(means.to_numpy(), expected.to_numpy())
+
+
+def test_changed_year_is_the_only_one_reingested(tmp_path):
+    source = tmp_path / 'source'
+    write_year(source, 2018, seed=5)
+    write_year(source, 2019, seed=6)
+    store = str(tmp_path / 'store')
+    ingest(str(source), store)
+    write_year(source, 2019, seed=7)
+    assert ingest(str(source), store) == ['2019']
+    assert ingest(str(source), store, force=True) == ['2018', '2019']
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from analysis_files.correlation import bootstrap_ci, correlate_by_state_year
+
+
+@pytest.fixture
+def cube():
+    # four states over two years; mental health follows precipitation plus noise, a few months missing
+    rng = np.random.default_rng(0)
+    months = np.arange(np.datetime64('2019-01'), np.datetime64('2021-01'))
+    precip = rng.gamma(2.0, 2.0, (4, len(months)))
+    mh_mean = 3.0 + 0.8 * precip + rng.normal(scale=1.0, size=precip.shape)
+    precip[0, 3] = np.nan
+    mh_mean[2, 15] = np.nan
+    mh_mean[3, 12:22] = np.nan    # only 2 months left in 2020: too few for a correlation
+    return {'states': np.array(['AL', 'CA', 'NY', 'WA']), 'months': months, 'precip': precip, 'mh_mean': mh_mean}
+
+
+def test_correlations_match_scipy(cube):
+    result = correlate_by_state_year(cube, n_resamples=0).set_index(['State', 'Year', 'Method'])
+    for s, state in enumerate(cube['states']):
+        for k, year in enumerate([2019, 2020]):
+            x = cube['precip'][s, 12 * k:12 * (k + 1)]
+            y = cube['mh_mean'][s, 12 * k:12 * (k + 1)]
+            both = ~(np.isnan(x) | np.isnan(y))
+            pearson, spearman = result.loc[(state, year, 'pearson')], result.loc[(state, year, 'spearman')]
+            assert pearson['N'] == spearman['N'] == both.sum()
+            if both.sum() < 4:
+                assert np.isnan(pearson['r']) and np.isnan(spearman['r'])
+                continue
+            assert pearson['r'] == pytest.approx(stats.pearsonr(x[both], y[both])[0])
+            assert spearman['r'] == pytest.approx(stats.spearmanr(x[both], y[both])[0])
+
+
+def test_bootstrap_ci_contains_estimate_and_is_reproducible(cube):
+    result = correlate_by_state_year(cube, n_resamples=500, n_jobs=1, seed=3).dropna(subset=['r'])
+    assert len(result) == 2 * 7
+    assert ((result['CI_Low'] <= result['r']) & (result['r'] <= result['CI_High'])).all()
+
+    # the same seed gives the same intervals, in-process or split over worker processes
+    again = correlate_by_state_year(cube, n_resamples=500, n_jobs=2, seed=3).dropna(subset=['r'])
+    np.testing.assert_array_equal(result[['CI_Low', 'CI_High']].to_numpy(), again[['CI_Low', 'CI_High']].to_numpy())
+    x, y = cube['precip'][:1, :12], cube['mh_mean'][:1, :12]
+    other = bootstrap_ci(x, y, n_resamples=500, n_jobs=1, seed=4)['pearson']
+    assert not np.array_equal(other, bootstrap_ci(x, y, n_resamples=500, n_jobs=1, seed=3)['pearson'])
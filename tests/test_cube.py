@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_files.cube import annual_means, build_monthly_cube, prefix_sums, range_means, season_ranges, select_metric
+
+
+@pytest.fixture
+def cube():
+    # three states over two years; some months without precipitation and some answers out of range
+    rng = np.random.default_rng(0)
+    decoder = pd.DataFrame({'_STATE': [1, 6, 53], 'Abbreviation': ['AL', 'CA', 'WA']})
+    months = pd.date_range('2019-01-01', '2020-12-01', freq='MS')
+    precip = pd.DataFrame({'time': np.repeat(months, 3), 'state_abbr': np.tile(['AL', 'CA', 'WA'], len(months)),
+                           'precip': rng.gamma(2, 2, 3 * len(months))})
+    precip.loc[rng.random(len(precip)) < 0.1, 'precip'] = np.nan
+    n = 2000
+    mental = pd.DataFrame({'_STATE': rng.choice([1, 6, 53], n), 'IYEAR': rng.choice([2019, 2020], n),
+                           'IMONTH': rng.integers(1, 13, n)})
+    for name in ['MENTHLTH', 'PHYSHLTH', 'POORHLTH']:
+        mental[name] = rng.integers(1, 35, n)    # 31-34 are outside the valid 1-30 range
+    mental['GENHLTH'] = rng.integers(1, 10, n)
+    return build_monthly_cube(precip, mental, decoder), precip, mental
+
+
+def test_cube_matches_groupby(cube):
+    cube, precip, mental = cube
+    # every metric's mean is the plain mean of its valid answers per state-month
+    codes = {1: 'AL', 6: 'CA', 53: 'WA'}
+    for i, name in enumerate(cube['metrics']):
+        high = 5 if name == 'GENHLTH' else 30
+        valid = mental[mental[name].between(1, high)]
+        expected = valid.groupby([valid['_STATE'].map(codes), 'IYEAR', 'IMONTH'])[name].mean()
+        for (state, year, month), value in expected.items():
+            s = list(cube['states']).index(state)
+            t = (year - 2019) * 12 + month - 1
+            assert cube['metric_mean'][s, t, i] == pytest.approx(value)
+            assert cube['metric_sum'][s, t, i] / cube['metric_count'][s, t, i] == pytest.approx(value)
+    np.testing.assert_array_equal(cube['mh_mean'], select_metric(cube, 'MENTHLTH')['mh_mean'])
+
+
+def test_prefix_sums_give_range_totals(cube):
+    cube, _, _ = cube
+    prefix = prefix_sums(cube)
+    for i, j in [(0, 0), (0, 23), (5, 17), (11, 12)]:
+        # C[:, j + 1] - C[:, i] is the total over months i..j
+        np.testing.assert_allclose(prefix['mh_sum'][:, j + 1] - prefix['mh_sum'][:, i],
+                                   cube['mh_sum'][:, i:j + 1].sum(axis=1))
+        np.testing.assert_allclose(prefix['metric_count'][:, j + 1] - prefix['metric_count'][:, i],
+                                   cube['metric_count'][:, i:j + 1].sum(axis=1))
+
+
+def test_range_means_match_direct_means(cube):
+    cube, _, _ = cube
+    prefix = prefix_sums(cube)
+    means = range_means(prefix, [('2019-03', '2020-08')])
+    window = slice(2, 20)
+    np.testing.assert_allclose(means['precip'], np.nanmean(cube['precip'][:, window], axis=1))
+    np.testing.assert_allclose(means['mh_mean'], cube['mh_sum'][:, window].sum(axis=1) / cube['mh_count'][:, window].sum(axis=1))
+
+    # several ranges pool their months, e.g. both winters
+    ranges = season_ranges('2019-01', '2020-12', (12, 1, 2))
+    assert [(str(start), str(end)) for start, end in ranges] == [('2019-01', '2019-02'), ('2019-12', '2020-02'),
+                                                                 ('2020-12', '2020-12')]
+    winter = np.isin(np.arange(24) % 12, [11, 0, 1])
+    means = range_means(prefix, ranges)
+    np.testing.assert_allclose(means['precip'], np.nanmean(cube['precip'][:, winter], axis=1))
+    np.testing.assert_allclose(means['mh_count'], cube['mh_count'][:, winter].sum(axis=1))
+
+
+def test_annual_means_match_range_means(cube):
+    cube, _, _ = cube
+    means, years = annual_means(cube)
+    assert list(years) == [2019, 2020]
+    for k, year in enumerate(years):
+        per_year = range_means(prefix_sums(cube), [(f'{year}-01', f'{year}-12')])
+        np.testing.assert_allclose(means['precip'][:, k], per_year['precip'])
+        np.testing.assert_allclose(means['mh_mean'][:, k], per_year['mh_mean'])
+        # the MENTHLTH slice of metric_mean is the same respondent-pooled mean
+        np.testing.assert_allclose(means['metric_mean'][:, k, 0], per_year['mh_mean'])
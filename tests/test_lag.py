@@ -0,0 +1,38 @@
+import numpy as np
+
+from analysis_files.lag import lagged_correlation
+
+
+def shifted_corrcoef(x, y, lag):
+    # Pearson r of x[t] and y[t + lag] over the months where both are present
+    a, b = x[:len(x) - lag], y[lag:]
+    both = ~(np.isnan(a) | np.isnan(b))
+    return np.corrcoef(a[both], b[both])[0, 1], both.sum()
+
+
+def test_lagged_correlation_matches_corrcoef():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(4, 60))
+    # y follows x two months later, plus noise, so lag 2 stands out
+    y = np.roll(x, 2, axis=1) + rng.normal(scale=0.5, size=x.shape)
+    x[rng.random(x.shape) < 0.15] = np.nan
+    y[rng.random(y.shape) < 0.15] = np.nan
+
+    r, n = lagged_correlation(x, y, max_lag=6, min_periods=12)
+    assert r.shape == n.shape == (4, 7)
+    for row in range(4):
+        for lag in range(7):
+            expected, count = shifted_corrcoef(x[row], y[row], lag)
+            assert n[row, lag] == count
+            np.testing.assert_allclose(r[row, lag], expected, atol=1e-10)
+    assert (r.argmax(axis=1) == 2).all()
+
+
+def test_lagged_correlation_needs_min_periods():
+    rng = np.random.default_rng(2)
+    x, y = rng.normal(size=20), rng.normal(size=20)
+    x[:10] = np.nan
+    r, n = lagged_correlation(x, y, max_lag=3, min_periods=10)
+    # lag 0 has 10 pairs, every later lag fewer
+    assert list(n) == [10, 9, 8, 7]
+    assert not np.isnan(r[0]) and np.isnan(r[1:]).all()
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from scipy import sparse
+
+from Precipitation.netcdf_engine import GridMapping, aggregate_chunked, aggregate_fields, grid_key, read_fields
+
+latitude = np.linspace(30.0, 48.0, 10)
+longitude = np.linspace(-120.0, -80.0, 16)
+variables = [{'name': 'precip', 'netcdf_variable': 'precip', 'scale': 2.0, 'offset': 0.5}]
+
+
+class FixedMappings:
+    # stands in for GridMappingCache: one fixed cells -> states weight matrix for the test grid,
+    # with the first and last latitude rows unused so the chunked reader has rows to skip
+    def __init__(self):
+        rng = np.random.default_rng(3)
+        weights = rng.random((3, latitude.size * longitude.size)) * (rng.random((3, latitude.size * longitude.size)) < 0.4)
+        weights = weights.reshape(3, latitude.size, longitude.size)
+        weights[:, [0, -1], :] = 0
+        self.dense = weights.reshape(3, -1)
+        self.mapping = None
+
+    def get(self, lat, lon, scheme='centroid'):
+        if self.mapping is None:
+            self.mapping = GridMapping(['AL', 'CA', 'WA'], sparse.csr_matrix(self.dense), grid_key(lat, lon, scheme))
+        return self.mapping
+
+
+def write_files(folder, times, rng):
+    # one NetCDF file per time step, ~20% of the cells missing
+    values = rng.gamma(2.0, 2.0, (len(times), latitude.size, longitude.size))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    paths = []
+    for i, time in enumerate(times):
+        path = str(folder / f"step_{pd.Timestamp(time):%Y%m%d}.nc")
+        xr.Dataset({'precip': (('time', 'latitude', 'longitude'), values[i:i + 1])},
+                   coords={'time': [time], 'latitude': latitude, 'longitude': longitude}).to_netcdf(path)
+        paths.append(path)
+    return paths, values * 2.0 + 0.5
+
+
+def test_chunked_matches_in_memory_for_monthly_files(tmp_path):
+    files, _ = write_files(tmp_path, pd.date_range('2020-01-01', periods=6, freq='MS'), np.random.default_rng(4))
+    mappings = FixedMappings()
+    in_memory = pd.concat(aggregate_fields(read_fields(files, variables), mappings))
+    # a tiny block budget forces several latitude blocks per file
+    chunked = pd.concat(aggregate_chunked(files, variables, mappings, max_block_mb=0.001))
+    merged = in_memory.merge(chunked, on=['time', 'state_abbr', 'variable'])
+    assert len(merged) == len(in_memory) == len(chunked) == 18
+    np.testing.assert_allclose(merged['value_x'], merged['value_y'], rtol=1e-12)
+
+
+def test_chunked_pools_daily_files_per_month(tmp_path):
+    days = pd.date_range('2020-01-01', '2020-02-29', freq='D')
+    files, values = write_files(tmp_path, days, np.random.default_rng(5))
+    mappings = FixedMappings()
+    chunked = pd.concat(aggregate_chunked(files, variables, mappings, max_block_mb=0.001))
+    assert len(chunked) == 2 * 3
+
+    # each month is sum(weight * value) / sum(weight) over every valid cell of every day in it
+    for month in ['2020-01', '2020-02']:
+        in_month = values[days.strftime('%Y-%m') == month].reshape(-1, latitude.size * longitude.size)
+        valid = ~np.isnan(in_month)
+        expected = (mappings.dense @ np.where(valid, in_month, 0).T).sum(axis=1) / (mappings.dense @ valid.T).sum(axis=1)
+        got = chunked[chunked['time'] == pd.Timestamp(month)].sort_values('state_abbr')['value'].to_numpy()
+        np.testing.assert_allclose(got, expected, rtol=1e-12)
+
+
+def test_later_file_replaces_the_same_time_step(tmp_path):
+    # preliminary and final files for the same month: the later file wins, like run() does for the in-memory path
+    (tmp_path / 'preliminary').mkdir()
+    (tmp_path / 'final').mkdir()
+    first, _ = write_files(tmp_path / 'preliminary', [np.datetime64('2020-01-01')], np.random.default_rng(6))
+    second, final = write_files(tmp_path / 'final', [np.datetime64('2020-01-01')], np.random.default_rng(7))
+    mappings = FixedMappings()
+    chunked = pd.concat(aggregate_chunked(first + second, variables, mappings))
+    only_final = pd.concat(aggregate_chunked(second, variables, mappings))
+    np.testing.assert_allclose(chunked['value'], only_final['value'])
+    assert chunked['value'].to_numpy() == pytest.approx(mappings.mapping.apply(final.reshape(1, -1))[0])
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from analysis_files.spatial import morans_i
+
+
+def path_graph(n):
+    # states 0 - 1 - 2 - ... - (n - 1), each bordering the next
+    edges = np.arange(n - 1)
+    W = sparse.coo_matrix((np.ones(n - 1), (edges, edges + 1)), shape=(n, n))
+    return (W + W.T).tocsr()
+
+
+def test_alternating_pattern_is_perfectly_dispersed():
+    # every neighbour of a high state is low and vice versa: row-standardized I is exactly -1
+    n = 20
+    states = np.array([f'S{i}' for i in range(n)])
+    values = np.where(np.arange(n) % 2 == 0, 10.0, 0.0)
+    result, local = morans_i(states, values, path_graph(n), n_permutations=999)
+    assert result['I'] == pytest.approx(-1.0)
+    assert result['Expected_I'] == pytest.approx(-1 / (n - 1))
+    assert result['P'] < 0.01
+    np.testing.assert_allclose(local['Lag'], -(values - values.mean()) / values.std())
+
+
+def test_clustered_pattern_and_lisa_clusters():
+    # a high block and a low block: positive I; with alpha=1 every state gets its quadrant
+    n = 20
+    states = np.array([f'S{i}' for i in range(n)])
+    values = np.where(np.arange(n) < n // 2, 10.0, 0.0) + np.linspace(0, 1, n)
+    result, local = morans_i(states, values, path_graph(n), n_permutations=999, alpha=1.0)
+    assert result['I'] > 0.7 and result['P'] < 0.01
+    clusters = local.set_index('State')['Cluster']
+    assert set(clusters[[f'S{i}' for i in range(n // 2 - 1)]]) == {'High-High'}
+    assert set(clusters[[f'S{i}' for i in range(n // 2 + 1, n)]]) == {'Low-Low'}
+    # the two states at the border have a neighbour on the other side; their lag keeps its sign
+    assert ((local['Local_I'] > 0) == (clusters.isin(['High-High', 'Low-Low']).to_numpy())).all()
+
+
+def test_missing_values_and_islands_are_left_out():
+    n = 8
+    states = np.array([f'S{i}' for i in range(n)])
+    values = np.arange(n, dtype=float)
+    values[3] = np.nan
+    # S7 has no neighbours (like AK / HI)
+    W = path_graph(n).tolil()
+    W[6, 7] = W[7, 6] = 0
+    result, local = morans_i(states, values, W.tocsr(), n_permutations=99)
+    assert result['N'] == n - 1
+    assert np.isnan(local.loc[3, 'Local_I']) and local.loc[3, 'Cluster'] is None
+    assert np.isnan(local.loc[7, 'Local_I']) and local.loc[7, 'Cluster'] == 'Not significant'
+
+
+def grid_graph(side):
+    # rook adjacency on a side x side grid (a stand-in for ~49 states)
+    cells = np.arange(side * side).reshape(side, side)
+    right = np.stack([cells[:, :-1].ravel(), cells[:, 1:].ravel()])
+    down = np.stack([cells[:-1, :].ravel(), cells[1:, :].ravel()])
+    rows, cols = np.concatenate([right, down], axis=1)
+    W = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(side * side, side * side))
+    return (W + W.T).tocsr()
+
+
+def test_planted_cluster_is_significant_and_high_high():
+    rng = np.random.default_rng(0)
+    side = 7
+    values = rng.normal(size=(side, side))
+    values[1:4, 1:4] += 6.0    # a 3 x 3 block of high states
+    states = np.array([f'S{i}' for i in range(side * side)])
+    result, local = morans_i(states, values.ravel(), grid_graph(side), n_permutations=999)
+    centre = 2 * side + 2
+    assert result['I'] > 0 and result['P'] < 0.01
+    assert local.loc[centre, 'Cluster'] == 'High-High' and local.loc[centre, 'P'] < 0.01
+    # a planted high block in a low background is never reported as Low-Low
+    block = np.zeros((side, side), dtype=bool)
+    block[1:4, 1:4] = True
+    assert (local.loc[block.ravel(), 'Cluster'] != 'Low-Low').all()
+
+
+def test_own_value_is_never_drawn_into_its_lag():
+    # with two states the only value a neighbour can take is the other state's, so every
+    # conditional permutation reproduces the observed lag and no local statistic is significant
+    W = path_graph(2)
+    _, local = morans_i(np.array(['A', 'B']), np.array([1.0, 5.0]), W, n_permutations=199)
+    assert (local['P'] == 1.0).all()
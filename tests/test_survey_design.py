@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from survey_design import weighted_means
+
+
+def test_equal_weights_one_psu_per_respondent():
+    # with equal weights and every respondent its own PSU in one stratum, the linearized SE is s / sqrt(n)
+    y = np.array([2.0, 5.0, 1.0, 8.0, 4.0, 30.0])
+    df = pd.DataFrame({'State': 'AL', 'MENTHLTH': y, '_LLCPWT': 3.0, '_STSTR': 1,
+                       '_PSU': np.arange(len(y)), 'YEAR': 2020})
+    result = weighted_means(df, ['State'])
+    assert result['Mean'].iloc[0] == pytest.approx(y.mean())
+    assert result['SE'].iloc[0] == pytest.approx(y.std(ddof=1) / np.sqrt(len(y)))
+    assert result['N'].iloc[0] == len(y) and result['SumWeights'].iloc[0] == pytest.approx(3.0 * len(y))
+
+
+def test_weighted_means_match_textbook_formula():
+    # two strata with three and two PSUs, a single-PSU stratum and two domains
+    df = pd.DataFrame({
+        'State':    ['AL', 'AL', 'AL', 'AL', 'CA', 'CA', 'AL', 'CA', 'CA', 'AL'],
+        'MENTHLTH': [3.0, 10.0, 1.0, 7.0, 2.0, 15.0, 4.0, 6.0, 20.0, 5.0],
+        '_LLCPWT':  [1.0, 2.0, 1.5, 0.5, 3.0, 1.0, 2.5, 1.0, 2.0, 4.0],
+        '_STSTR':   [1, 1, 1, 1, 1, 2, 2, 2, 2, 3],
+        '_PSU':     [1, 1, 2, 3, 3, 1, 1, 2, 2, 1],
+        'YEAR': 2020,
+    })
+    result = weighted_means(df, ['State']).set_index('State')
+
+    for state, row in result.iterrows():
+        domain = df['State'] == state
+        w, y = df['_LLCPWT'].to_numpy(), df['MENTHLTH'].to_numpy()
+        mean = (w * y)[domain].sum() / w[domain].sum()
+        # linearized values, zero outside the domain, totalled per PSU
+        u = np.where(domain, w * (y - mean) / w[domain].sum(), 0.0)
+        variance = 0.0
+        for _, stratum in df.assign(u=u).groupby('_STSTR'):
+            totals = stratum.groupby('_PSU')['u'].sum().to_numpy()
+            if len(totals) > 1:
+                variance += len(totals) / (len(totals) - 1) * ((totals - totals.mean()) ** 2).sum()
+        assert row['Mean'] == pytest.approx(mean)
+        assert row['SE'] == pytest.approx(np.sqrt(variance))
+        assert row['N'] == domain.sum()
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+import catalog_files.catalog as catalog
+import catalog_files.watcher as watcher
+from catalog_files.watcher import DataWatcher
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    # two small datasets in place of the app's CSVs
+    paths = {'rain': tmp_path / 'rain.csv', 'survey': tmp_path / 'survey.csv'}
+    pd.DataFrame({'time': ['2020-01-01', '2020-02-01'], 'state_abbr': 'AL', 'precip': [1.0, 2.0]}).to_csv(paths['rain'], index=False)
+    pd.DataFrame({'Year': [2020, 2020], 'State': 'AL', 'value': [3.0, 5.0]}).to_csv(paths['survey'], index=False)
+    datasets = {'rain': {'path': str(paths['rain']), 'time': 'time', 'state': 'state_abbr', 'values': ['precip']},
+                'survey': {'path': str(paths['survey']), 'year': 'Year', 'state': 'State', 'values': ['value']}}
+    monkeypatch.setattr(catalog, 'datasets', datasets)
+    monkeypatch.setattr(watcher, 'datasets', datasets)
+    return paths
+
+
+def counting_builders(calls):
+    # rain_df <- rain, survey_df <- survey, both <- rain_df + survey_df; every build is counted
+    def build(name, make):
+        def run(data, catalog):
+            calls.append(name)
+            return make(data, catalog)
+        return run
+    read = lambda dataset: lambda data, catalog: pd.read_csv(catalog['datasets'][dataset]['path'])
+    return [
+        ('rain_df', ['rain'], build('rain_df', read('rain'))),
+        ('survey_df', ['survey'], build('survey_df', read('survey'))),
+        ('both', ['rain_df', 'survey_df'],
+         build('both', lambda data, catalog: data['rain_df']['precip'].sum() + data['survey_df']['value'].sum())),
+    ]
+
+
+def test_poll_rebuilds_only_downstream_builders(files, tmp_path):
+    calls = []
+    w = DataWatcher(counting_builders(calls), path=str(tmp_path / 'catalog.json'))
+    first = w.snapshot
+    assert calls == ['rain_df', 'survey_df', 'both'] and first['both'] == 11.0
+    survey_total = first.cached('survey_total', ['survey_df'], lambda data: data['survey_df']['value'].sum())
+    rain_total = first.cached('rain_total', ['rain_df'], lambda data: data['rain_df']['precip'].sum())
+    assert (survey_total, rain_total) == (8.0, 3.0)
+
+    # nothing changed: no rebuild, same snapshot
+    calls.clear()
+    assert w.poll() == [] and w.snapshot is first and calls == []
+
+    pd.DataFrame({'Year': [2020, 2020], 'State': 'AL', 'value': [3.0, 7.0]}).to_csv(files['survey'], index=False)
+    # the first poll sees the file change and waits for it to settle; the second one rebuilds
+    assert w.poll() == [] and w.snapshot is first
+    assert w.poll() == ['survey']
+    second = w.snapshot
+    assert calls == ['survey_df', 'both']
+    assert second['rain_df'] is first['rain_df'] and second['both'] == 13.0
+    # cached entries follow the same rule: survey_total is rebuilt, rain_total is shared
+    assert second.derived['survey_total'][2] == 10.0
+    assert second.derived['rain_total'][2] == 3.0 and second.version > first.version
+    # the old snapshot is untouched
+    assert first['both'] == 11.0 and first.derived['survey_total'][2] == 8.0
+
+
+def test_broken_file_keeps_the_current_snapshot(files, tmp_path, capsys):
+    calls = []
+    w = DataWatcher(counting_builders(calls), path=str(tmp_path / 'catalog.json'))
+    first = w.snapshot
+    files['rain'].write_text('not,a\n"valid')
+    w.poll()
+    assert w.poll() == [] and w.snapshot is first
+    assert 'Traceback' in capsys.readouterr().err
+    # fixed on a later poll: picked up then
+    pd.DataFrame({'time': ['2020-01-01'], 'state_abbr': 'AL', 'precip': [4.0]}).to_csv(files['rain'], index=False)
+    w.poll()
+    assert w.poll() == ['rain'] and w.snapshot['both'] == 12.0
+
+
+def test_dataset_that_appears_later_is_built(files, tmp_path):
+    # like the county data: not built yet when the app starts, picked up once it is written
+    files['rain'].unlink()
+    calls = []
+    builders = [('rain_df', ['rain'], lambda data, catalog: calls.append('rain_df') or (
+        pd.read_csv(catalog['datasets']['rain']['path']) if 'rain' in catalog['datasets'] else None))]
+    w = DataWatcher(builders, path=str(tmp_path / 'catalog.json'))
+    assert w.snapshot['rain_df'] is None and 'rain' not in w.snapshot.catalog['datasets']
+    pd.DataFrame({'time': ['2020-01-01'], 'state_abbr': 'AL', 'precip': [4.0]}).to_csv(files['rain'], index=False)
+    w.poll()
+    assert w.poll() == ['rain'] and w.snapshot['rain_df']['precip'].tolist() == [4.0]
+    assert calls == ['rain_df', 'rain_df']